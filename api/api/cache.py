@@ -0,0 +1,21 @@
+"""Helpers for code relying on the default cache being shared by every worker"""
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(alias='default'):
+    """Whether every worker process sees the same entries of the cache"""
+    return not isinstance(caches[alias], LocMemCache)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared():
+        return []
+    return [checks.Warning(
+        'The default cache is local to each process.',
+        hint=('Drive token refresh coalescing and rate limits only hold within one '
+              'worker, and OAuth2 tokens are cached for OAUTH2_TOKEN_LOCAL_CACHE_TTL '
+              'seconds at most. Configure a shared backend in CACHES.'),
+        id='api.W001',
+    )]
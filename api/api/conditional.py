@@ -0,0 +1,32 @@
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+import hashlib
+
+
+class ConditionalGetMixin:
+    """ETag validation and Cache-Control headers for APIView reads
+
+    A view sets self.etag from cheap columns before serializing and returns
+    early when not_modified() gives a response; finalize_response adds the
+    ETag, Cache-Control and Vary headers to 200 and 304 replies.
+    """
+    cache_control = {'private': True, 'max_age': 0}
+    etag = None
+
+    @staticmethod
+    def make_etag(*parts):
+        return quote_etag(hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:32])
+
+    def not_modified(self, request, *parts):
+        """Record the validator for the response, returning a 304 when the client has it"""
+        self.etag = self.make_etag(*parts)
+        return get_conditional_response(request, etag=self.etag)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            if self.etag:
+                response['ETag'] = self.etag
+            patch_cache_control(response, **self.cache_control)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
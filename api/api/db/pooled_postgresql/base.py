@@ -0,0 +1,214 @@
+"""PostgreSQL backend reusing connections from a bounded per-process pool
+
+Enabled with DATABASE_POOL in settings. Django still opens and closes its
+connection around each request; closing hands the psycopg2 connection back
+to the pool and opening takes an idle one when there is one. The pool is
+configured from the POOL entry of the database settings:
+
+    MAX_SIZE      open connections per process, checkouts wait beyond it
+    TIMEOUT       seconds a checkout waits for a free slot
+    MAX_LIFETIME  seconds after which a connection is closed and replaced
+    PRE_PING      run SELECT 1 before handing out an idle connection
+
+Idle connections keep their database open, so the test database is drained
+from the pools before it is dropped or used as a template.
+"""
+from django.db import DatabaseError
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresDatabaseWrapper
+from django.db.backends.postgresql.creation import DatabaseCreation as PostgresDatabaseCreation
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from collections import Counter, deque
+import threading
+import time
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'MAX_LIFETIME': 1800,
+    'PRE_PING': True,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Bounded pool of open DB-API connections"""
+
+    def __init__(self, max_size, timeout, max_lifetime, pre_ping):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.in_use = {}
+        self.counters = Counter()
+
+    def acquire(self, connect):
+        """Take a healthy idle connection, or open one with connect()"""
+        if not self.slots.acquire(timeout=self.timeout):
+            self.count('timeouts')
+            raise DatabaseError(
+                f'No database connection available within {self.timeout}s '
+                f'(pool size {self.max_size})'
+            )
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    connection, created = self.idle.pop()
+                if self.usable(connection, created):
+                    self.count('reused')
+                    return self.check_out(connection, created)
+                self.discard(connection)
+
+            connection = connect()
+            self.count('created')
+            return self.check_out(connection, time.monotonic())
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def check_out(self, connection, created):
+        with self.lock:
+            self.in_use[connection] = created
+        return connection
+
+    def usable(self, connection, created):
+        if connection.closed:
+            return False
+        if time.monotonic() - created > self.max_lifetime:
+            self.count('recycled')
+            return False
+        if self.pre_ping:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                connection.rollback()
+            except Exception:
+                self.count('ping_failures')
+                return False
+        return True
+
+    def release(self, connection):
+        """Return a checked out connection, closing it if it can't be reused"""
+        with self.lock:
+            created = self.in_use.pop(connection, None)
+        if created is None:
+            return
+        try:
+            if not connection.closed:
+                connection.rollback()
+                with self.lock:
+                    self.idle.append((connection, created))
+                return
+        except Exception:
+            pass
+        finally:
+            self.slots.release()
+        self.discard(connection)
+
+    def drain(self):
+        """Close the idle connections, checked out ones are closed by their owner"""
+        with self.lock:
+            idle, self.idle = self.idle, deque()
+        for connection, created in idle:
+            self.discard(connection)
+
+    def discard(self, connection):
+        self.count('discarded')
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_size': self.max_size,
+                'in_use': len(self.in_use),
+                'idle': len(self.idle),
+                **{name: self.counters[name] for name in
+                   ('created', 'reused', 'recycled', 'ping_failures', 'discarded', 'timeouts')}
+            }
+
+
+def get_pool(alias, settings_dict, conn_params):
+    # Keyed on the connection parameters too, so switching databases (as
+    # the test runner does) never hands out a connection to the old one
+    key = (alias, settings_dict['NAME'], repr(sorted(conn_params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {**POOL_DEFAULTS, **settings_dict.get('POOL', {})}
+            pool = _pools[key] = ConnectionPool(
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                max_lifetime=options['MAX_LIFETIME'],
+                pre_ping=options['PRE_PING']
+            )
+        return pool
+
+
+def pool_stats():
+    """Statistics of the pools opened by this process, per alias and database name"""
+    with _pools_lock:
+        pools = dict(_pools)
+    stats = {}
+    for (alias, name, params), pool in pools.items():
+        label = f'{alias}:{name}'
+        if label in stats:
+            label = f'{label}:{len(stats)}'
+        stats[label] = pool.stats()
+    return stats
+
+
+def drain_pools(name=None):
+    """Close the idle connections of the pools to database name, or of every pool"""
+    with _pools_lock:
+        pools = [pool for (alias, pool_name, params), pool in _pools.items()
+                 if name is None or pool_name == name]
+    for pool in pools:
+        pool.drain()
+
+
+class DatabaseCreation(PostgresDatabaseCreation):
+    """Test database handling, with pooled connections closed before DROP or CREATE ... TEMPLATE"""
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        drain_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.connection.close()
+        drain_pools(self.connection.settings_dict['NAME'])
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+
+class DatabaseWrapper(PostgresDatabaseWrapper):
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.alias, self.settings_dict, conn_params)
+        connection = self.pool.acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+        # Normally set while connecting, so reused connections need it too
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (
+            IsolationLevel.READ_COMMITTED if isolation_level is None
+            else IsolationLevel(isolation_level)
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.release(self.connection)
@@ -0,0 +1,331 @@
+"""Per-request timing breakdown and Prometheus metrics
+
+InstrumentationMiddleware opens a RequestMetrics for every request. Code on
+the hot path adds to it through span() and upstream_call(): Google API calls,
+credential refreshes and response rendering. The middleware itself times
+the database queries. Totals feed in-process histograms served by
+MetricsView in the Prometheus text format. A sample of the requests
+slower than SLOW_REQUEST_THRESHOLD is logged with their breakdown.
+"""
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views import View
+from googleapiclient.http import HttpRequest
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from api.db.pooled_postgresql.base import pool_stats
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from collections import defaultdict
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Time spent by one request, split by where it went"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.upstream = []
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.spans = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def add_upstream(self, method, seconds, status):
+        with self.lock:
+            self.upstream.append((method, seconds, status))
+
+    def add_query(self, seconds):
+        with self.lock:
+            self.db_queries += 1
+            self.db_time += seconds
+
+    def add_span(self, name, seconds):
+        with self.lock:
+            self.spans[name] += seconds
+
+    def to_dict(self):
+        return {
+            'upstream': [
+                {'method': method, 'ms': round(seconds * 1000, 1), 'status': status}
+                for method, seconds, status in self.upstream
+            ],
+            'upstream_ms': round(sum(seconds for _, seconds, _ in self.upstream) * 1000, 1),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_time * 1000, 1),
+            **{f'{name}_ms': round(seconds * 1000, 1) for name, seconds in self.spans.items()}
+        }
+
+
+@contextmanager
+def span(name):
+    """Time a block of the current request under name, e.g. 'credential_refresh'"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_span(name, time.perf_counter() - start)
+
+
+@contextmanager
+def upstream_call(method):
+    """Time a call to a Google API, method being e.g. 'drive.files.get'"""
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        yield
+        status = 'ok'
+    finally:
+        seconds = time.perf_counter() - start
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_upstream(method, seconds, status)
+        registry.observe('google_api_request_duration_seconds', {'method': method, 'status': status}, seconds)
+
+
+class InstrumentedHttpRequest(HttpRequest):
+    """googleapiclient request recording each call, passed to build as requestBuilder"""
+
+    def execute(self, http=None, num_retries=0):
+        with upstream_call(self.methodId):
+            return super().execute(http=http, num_retries=num_retries)
+
+    def next_chunk(self, http=None, num_retries=0):
+        with upstream_call(f'{self.methodId}.upload'):
+            return super().next_chunk(http=http, num_retries=num_retries)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """In-process counters and histograms, one series per label set"""
+
+    help = {
+        'http_request_duration_seconds': 'Time to serve a request, per view',
+        'http_request_db_queries': 'Database queries per request, per view',
+        'http_request_db_seconds': 'Database time per request, per view',
+        'http_request_upstream_calls': 'Google API calls per request, per view',
+        'http_request_upstream_seconds': 'Google API time per request, per view',
+        'http_request_render_seconds': 'Response rendering time per request, per view',
+        'google_api_request_duration_seconds': 'Google API call latency, per API method',
+        'google_credential_refresh_seconds': 'OAuth credential refresh latency',
+        'google_api_retries_total': 'Google API calls retried, per API method and reason',
+        'google_api_retries_exhausted_total': 'Google API calls failed after the last retry, per API method',
+        'google_api_throttled_total': 'Google API calls delayed by a rate limit bucket, per scope',
+        'google_api_rate_limited_total': 'Google API calls refused after waiting too long for a token, per scope',
+        'google_api_throttle_wait_seconds': 'Time Google API calls waited for a rate limit token, per scope',
+        'drive_metadata_cache_requests_total': 'Drive metadata cache lookups, per call and result (hit or miss)',
+        'drive_download_cache_requests_total': 'Cacheable downloads, per result (hit, join of a fill in progress or miss)',
+        'drive_download_cache_evictions_total': 'Files evicted from the download cache',
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.requests = defaultdict(int)
+        self.counters = defaultdict(int)
+
+    def observe(self, name, labels, value, buckets=BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def count_request(self, labels):
+        with self.lock:
+            self.requests[tuple(sorted(labels.items()))] += 1
+
+    def increment(self, name, labels, value=1):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    @staticmethod
+    def format_labels(labels, **extra):
+        pairs = [*labels, *extra.items()]
+        return '{' + ','.join(
+            '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+            for name, value in pairs
+        ) + '}'
+
+    def render(self, gauges=()):
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            requests = sorted(self.requests.items())
+            counters = sorted(self.counters.items())
+            snapshot = [
+                (name, labels, list(histogram.buckets), list(histogram.counts), histogram.sum)
+                for (name, labels), histogram in histograms
+            ]
+
+        lines = [
+            '# HELP http_requests_total Requests served, per view, method and status',
+            '# TYPE http_requests_total counter',
+        ]
+        lines += [f'http_requests_total{self.format_labels(labels)} {count}' for labels, count in requests]
+
+        described = set()
+        for (name, labels), count in counters:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {self.help.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{self.format_labels(labels)} {count}')
+
+        for name, labels, buckets, counts, total in snapshot:
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {self.help.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(buckets, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{self.format_labels(labels, le=bound)} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{name}_bucket{self.format_labels(labels, le="+Inf")} {cumulative}')
+            lines.append(f'{name}_sum{self.format_labels(labels)} {total}')
+            lines.append(f'{name}_count{self.format_labels(labels)} {cumulative}')
+
+        for name, help_text, samples in gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines += [f'{name}{self.format_labels(sorted(labels.items()))} {value}'
+                      for labels, value in samples]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class InstrumentationMiddleware:
+    """Record where each request spent its time, in sync and async stacks alike"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.timed_queries(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            # Connections belong to threads, the ORM runs in the request's
+            # sync_to_async thread rather than on the event loop
+            queries = await sync_to_async(self.timed_queries)(metrics)
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(queries.close)()
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    @staticmethod
+    def timed_queries(metrics):
+        def wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                metrics.add_query(time.perf_counter() - start)
+
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        return stack
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns
+        start = time.perf_counter()
+        metrics = _current.get()
+
+        def rendered(response):
+            if metrics is not None:
+                metrics.add_span('render', time.perf_counter() - start)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        duration = time.perf_counter() - metrics.start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        labels = {'view': view, 'method': request.method}
+        registry.count_request({**labels, 'status': response.status_code})
+        registry.observe('http_request_duration_seconds', labels, duration)
+        registry.observe('http_request_db_queries', labels, metrics.db_queries, COUNT_BUCKETS)
+        registry.observe('http_request_db_seconds', labels, metrics.db_time)
+        registry.observe('http_request_upstream_calls', labels, len(metrics.upstream), COUNT_BUCKETS)
+        registry.observe('http_request_upstream_seconds', labels,
+                         sum(seconds for _, seconds, _ in metrics.upstream))
+        registry.observe('http_request_render_seconds', labels, metrics.spans.get('render', 0.0))
+        if 'credential_refresh' in metrics.spans:
+            registry.observe('google_credential_refresh_seconds', {}, metrics.spans['credential_refresh'])
+
+        threshold = settings.SLOW_REQUEST_THRESHOLD
+        if (threshold is not None and duration >= threshold
+                and random.random() < settings.SLOW_REQUEST_SAMPLE_RATE):
+            logger.warning(f"Slow request {request.method} {request.path} ({view}) "
+                           f"{duration * 1000:.0f} ms: {json.dumps(metrics.to_dict())}")
+
+
+class MetricsView(View):
+    """Prometheus scrape endpoint for the metrics of this process"""
+
+    def get(self, request):
+        allowed = settings.METRICS_ALLOWED_IPS
+        if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+            return HttpResponseForbidden()
+        return HttpResponse(
+            registry.render(self.gauges()),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+    @staticmethod
+    def gauges():
+        samples = []
+        for database, stats in pool_stats().items():
+            for state in ('in_use', 'idle'):
+                samples.append(({'database': database, 'state': state}, stats[state]))
+        return [('db_pool_connections', 'Pooled database connections by state', samples)]
@@ -0,0 +1,28 @@
+"""Streaming request parsers"""
+from rest_framework.parsers import BaseParser
+import json
+
+
+class NDJSONParser(BaseParser):
+    """Newline-delimited JSON, one item per line
+
+    request.data is a lazy iterator over the items, so a large stream is
+    never held in memory. A line that is not valid JSON yields a ValueError
+    in its place instead of failing the whole request.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return self.iter_items(stream)
+
+    @staticmethod
+    def iter_items(stream):
+        if stream is None:
+            return
+        for line in stream:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield ValueError(f'Invalid JSON: {e}')
@@ -0,0 +1,55 @@
+"""JSON output through orjson when it is installed
+
+FastJSONRenderer and JsonResponse are drop-in replacements for DRF's
+JSONRenderer and django.http.JsonResponse. orjson serializes dates, times
+and UUIDs natively and falls back to the stdlib encoders' default() for
+everything else; without orjson both behave exactly like the originals.
+"""
+from django.core.serializers.json import DjangoJSONEncoder
+from django import http
+from rest_framework.renderers import JSONRenderer
+from api.instrumentation import span
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+def dumps(data, encoder=DjangoJSONEncoder):
+    """Compact UTF-8 JSON bytes"""
+    if orjson is None:
+        return json.dumps(data, cls=encoder, ensure_ascii=False, separators=(',', ':')).encode()
+    return orjson.dumps(data, default=encoder().default, option=OPTIONS)
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = dumps(data, encoder=self.encoder_class)
+        # Same escaping as JSONRenderer, keeping the output a strict javascript subset
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class JsonResponse(http.JsonResponse):
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if orjson is None or json_dumps_params:
+            with span('render'):
+                return super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the '
+                'safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        with span('render'):
+            content = dumps(data, encoder=encoder)
+        http.HttpResponse.__init__(self, content=content, **kwargs)
@@ -60,6 +60,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'user',
@@ -96,11 +97,15 @@ AUTHENTICATION_BACKENDS = [
 ]
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'oauth2_provider.contrib.rest_framework.OAuth2Authentication',
+        'user.authentication.CachedOAuth2Authentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
 ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 
@@ -119,6 +124,7 @@ SOCIALACCOUNT_PROVIDERS = {
 }
 
 MIDDLEWARE = [
+    'api.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -154,17 +160,37 @@ WSGI_APPLICATION = 'api.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Reuse connections from a bounded per-process pool (api/db/pooled_postgresql)
+# instead of connecting to Postgres on every request
+DATABASE_POOL = False
+
 DATABASES = {
     "default": {
-        "ENGINE":"django.db.backends.postgresql",
+        "ENGINE":"api.db.pooled_postgresql" if DATABASE_POOL else "django.db.backends.postgresql",
         "NAME": "autome",
         "USER": "postgres",
         "PASSWORD": "postgres",
         "HOST": "localhost",
         "PORT": "5432",
+        "POOL": {
+            "MAX_SIZE": 10,
+            "TIMEOUT": 10,
+            "MAX_LIFETIME": 1800,
+            "PRE_PING": True,
+        },
     }
 
      
+}
+# The OAuth2 token cache, Drive token refresh coalescing and the Drive rate
+# limits only hold across processes with a shared backend (see api/cache.py),
+# e.g. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://localhost:6379/0. Defaults to a per-process cache.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
 }
 '''
 env = environ.Env()
@@ -216,3 +242,103 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Google API service clients
+GOOGLE_SERVICE_CACHE_SIZE = 256
+GOOGLE_SERVICE_CACHE_TTL = 300
+# Fallback lifetime of the cached Drive user email when the token has no expiry
+GOOGLE_USER_EMAIL_TTL = 3600
+# Size of the chunks relayed from Drive to the client during downloads
+GOOGLE_DRIVE_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Disk cache of downloaded contents, keyed by file id and checksum. Least
+# recently used files are evicted past GOOGLE_DRIVE_DOWNLOAD_CACHE_SIZE bytes
+# (None disables the cache) and larger files than the max are never cached
+GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR = os.path.join(BASE_DIR, 'drive', 'download_cache')
+GOOGLE_DRIVE_DOWNLOAD_CACHE_SIZE = 1024 * 1024 * 1024
+GOOGLE_DRIVE_DOWNLOAD_CACHE_MAX_FILE_SIZE = 100 * 1024 * 1024
+# Resumable uploads are spooled here and sent to Drive in chunks of this size
+# (must be a multiple of 256 KiB)
+GOOGLE_DRIVE_UPLOAD_DIR = os.path.join(BASE_DIR, 'drive', 'uploads')
+GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Uploads not completed within this many seconds are removed with their spooled
+# file by manage.py clean_uploads (Drive expires resumable sessions after a week)
+GOOGLE_DRIVE_UPLOAD_EXPIRY = 7 * 24 * 3600
+# Maximum number of calls grouped in one Drive batch request
+GOOGLE_DRIVE_BATCH_SIZE = 100
+# Drive listing page sizes (Drive accepts at most 1000)
+GOOGLE_DRIVE_PAGE_SIZE = 100
+GOOGLE_DRIVE_MAX_PAGE_SIZE = 1000
+# Default freshness bound (seconds) for serving Drive listings and details
+# from the local metadata mirror, None to always query Drive unless the
+# caller passes ?max_age=
+GOOGLE_DRIVE_MIRROR_MAX_AGE = None
+
+# Seconds a request may hold its claim on refreshing a user's mirror before
+# another request is allowed to take over the refresh
+GOOGLE_DRIVE_MIRROR_SYNC_TIMEOUT = 300
+# Async HTTP client used by the async drive views, one per event loop (under
+# WSGI their calls all run on one background loop)
+GOOGLE_ASYNC_TIMEOUT = 30
+GOOGLE_ASYNC_MAX_CONNECTIONS = 100
+# OAuth token refresh coalescing. Refreshed tokens and the refresh lock live
+# in the default cache, which must be shared (e.g. memcached or redis) for
+# the coalescing to span worker processes.
+GOOGLE_TOKEN_REFRESH_MARGIN = 600
+GOOGLE_TOKEN_REFRESH_LOCK_TIMEOUT = 30
+GOOGLE_TOKEN_REFRESH_WAIT = 10
+# Threads refreshing tokens ahead of expiry, per process
+GOOGLE_TOKEN_REFRESH_WORKERS = 4
+# Drive OAuth credentials are kept in the DriveToken table, referenced by a
+# signed cookie, with decoded credentials cached in-process
+GOOGLE_TOKEN_COOKIE_AGE = 60 * 60 * 24 * 30
+GOOGLE_CREDENTIAL_CACHE_SIZE = 1024
+GOOGLE_CREDENTIAL_CACHE_TTL = 300
+# How long the ownership/version of a file read by a user is trusted for
+# writes before it is fetched from Drive again
+GOOGLE_FILE_STATE_TTL = 300
+# Longest a user reuses cached files.get and permissions.list responses;
+# writes made through this API update the cache right away
+GOOGLE_FILE_METADATA_TTL = 60
+# Retries of Drive calls failing with 429, 5xx or a rate limit 403, waiting
+# up to GOOGLE_DRIVE_BACKOFF_MAX seconds between attempts
+GOOGLE_DRIVE_MAX_RETRIES = 5
+GOOGLE_DRIVE_BACKOFF_BASE = 0.5
+GOOGLE_DRIVE_BACKOFF_MAX = 32
+# Drive calls per second allowed per user and for the whole project, with the
+# burst size of each bucket; None disables a limit. Calls wait for a token up
+# to GOOGLE_DRIVE_THROTTLE_MAX_WAIT seconds, then fail
+GOOGLE_DRIVE_USER_RATE = 20
+GOOGLE_DRIVE_USER_BURST = 100
+GOOGLE_DRIVE_PROJECT_RATE = 180
+GOOGLE_DRIVE_PROJECT_BURST = 500
+GOOGLE_DRIVE_THROTTLE_MAX_WAIT = 10
+
+# Documentation listing page sizes
+DOCUMENT_PAGE_SIZE = 100
+DOCUMENT_MAX_PAGE_SIZE = 1000
+# Number of documents validated and written per transaction by bulk endpoints
+DOCUMENT_BULK_CHUNK_SIZE = 1000
+# Deepest result reachable through document search paging
+DOCUMENT_SEARCH_MAX_RESULTS = 1000
+# Seconds clients and the CDN may reuse document reads before revalidating
+DOCUMENT_CACHE_MAX_AGE = 60
+
+# User listing page sizes
+USER_PAGE_SIZE = 100
+USER_MAX_PAGE_SIZE = 1000
+# Seconds clients may reuse a user detail before revalidating
+USER_CACHE_MAX_AGE = 0
+
+# Upper bound on how long a validated OAuth2 access token is trusted without
+# checking the database again; tokens are also never cached past expiry
+OAUTH2_TOKEN_CACHE_TTL = 300
+# Same bound when the cache is local to each process, where a revocation
+# only reaches the worker that handled it
+OAUTH2_TOKEN_LOCAL_CACHE_TTL = 5
+
+# Clients allowed to scrape /metrics, None to allow everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# Log the timing breakdown of this fraction of the requests slower than
+# SLOW_REQUEST_THRESHOLD seconds, None to disable
+SLOW_REQUEST_THRESHOLD = None
+SLOW_REQUEST_SAMPLE_RATE = 0.1
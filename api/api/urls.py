@@ -16,6 +16,8 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
+from api.views import DatabasePoolView
+from api.instrumentation import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,4 +27,6 @@ urlpatterns = [
     path('auth/', include('dj_rest_auth.urls')),
     path('auth/registration/', include('dj_rest_auth.registration.urls')),
     path('drive/', include('drive.urls')),
+    path('db-pool/', DatabasePoolView.as_view()),
+    path('metrics', MetricsView.as_view()),
 ]
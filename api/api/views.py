@@ -0,0 +1,12 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser
+from api.db.pooled_postgresql.base import pool_stats
+
+
+class DatabasePoolView(APIView):
+    """Connection pool statistics of the process serving the request"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
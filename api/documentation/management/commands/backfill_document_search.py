@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from documentation.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Compute Document.search_vector for existing rows in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every row, not only rows without a vector')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.order_by('id')
+        if not options['all']:
+            documents = documents.filter(search_vector__isnull=True)
+
+        last_id = None
+        total = 0
+        while True:
+            batch = documents
+            if last_id is not None:
+                batch = batch.filter(id__gt=last_id)
+            ids = list(batch.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            with transaction.atomic():
+                Document.objects.filter(id__in=ids).update(
+                    search_vector=Document.search_vector_expression()
+                )
+            last_id = ids[-1]
+            total += len(ids)
+            self.stdout.write(f"{total} documents indexed")
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {total} documents"))
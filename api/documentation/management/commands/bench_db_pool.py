@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from user.models import UserCustomer
+from api.db.pooled_postgresql.base import pool_stats
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import httpx
+import secrets
+import threading
+import time
+
+ENGINES = {
+    'direct': 'django.db.backends.postgresql',
+    'pooled': 'api.db.pooled_postgresql',
+}
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second on documentation endpoints with and without the connection pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Endpoint to request, may be repeated')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [
+            '/documentation/document-list/?page_size=20',
+            '/documentation/document-search/?q=rapport',
+        ]
+        token = secrets.token_urlsafe(32)
+        user = UserCustomer.objects.create_user(username=f'bench-db-pool-{token[:8]}')
+        application = Application.objects.create(
+            name='bench-db-pool',
+            user=user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        AccessToken.objects.create(
+            user=user,
+            application=application,
+            token=token,
+            expires=timezone.now() + timedelta(hours=1)
+        )
+        settings_dict = connections.settings['default']
+        engine = settings_dict['ENGINE']
+        try:
+            for mode, backend in ENGINES.items():
+                settings_dict['ENGINE'] = backend
+                rate = self.run(paths, token, options['requests'], options['concurrency'])
+                self.stdout.write(f"{mode}: {rate:.0f} requests/s")
+            self.stdout.write(f"pool: {pool_stats()}")
+        finally:
+            settings_dict['ENGINE'] = engine
+            connections.close_all()
+            user.delete()
+
+    def run(self, paths, token, count, concurrency):
+        connections.close_all()
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host, port = server.server_address[:2]
+        headers = {'Authorization': f'Bearer {token}'}
+
+        def worker(offset):
+            with httpx.Client(base_url=f'http://{host}:{port}', headers=headers) as client:
+                for i in range(offset, count, concurrency):
+                    client.get(paths[i % len(paths)]).raise_for_status()
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as executor:
+                list(executor.map(worker, range(concurrency)))
+            return count / (time.perf_counter() - start)
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse as StdlibJsonResponse
+from rest_framework.renderers import JSONRenderer
+from api.renderers import FastJSONRenderer, JsonResponse, orjson
+from documentation.models import Document
+from documentation.serializers import DocumentSerializer
+from datetime import date, timedelta
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare the stdlib and orjson JSON paths on a listing of Document rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed, both paths use the stdlib encoder')
+
+        start = date(2024, 1, 1)
+        documents = [
+            Document(
+                id=str(i),
+                nom_document=f'Rapport trimestriel n°{i}',
+                description='Synthèse des opérations du trimestre ' * 4,
+                type_document=('facture', 'contrat', 'rapport')[i % 3],
+                date_creation=start + timedelta(days=i % 365),
+                date_modification=start + timedelta(days=i % 365 + 7)
+            )
+            for i in range(options['rows'])
+        ]
+        payload = {'results': DocumentSerializer(documents, many=True).data, 'next_cursor': None}
+        raw = [
+            {
+                'id': document.id,
+                'nom_document': document.nom_document,
+                'description': document.description,
+                'type_document': document.type_document,
+                'date_creation': document.date_creation,
+                'date_modification': document.date_modification
+            }
+            for document in documents
+        ]
+
+        def best(render):
+            timings = []
+            for _ in range(options['repeat']):
+                begin = time.perf_counter()
+                size = len(render())
+                timings.append(time.perf_counter() - begin)
+            return min(timings) * 1000, size
+
+        results = [
+            ('DRF JSONRenderer', best(lambda: JSONRenderer().render(payload))),
+            ('FastJSONRenderer', best(lambda: FastJSONRenderer().render(payload))),
+            ('django JsonResponse, raw dates', best(
+                lambda: StdlibJsonResponse({'files': raw}).content)),
+            ('api JsonResponse, raw dates', best(
+                lambda: JsonResponse({'files': raw}).content)),
+        ]
+        rows = options['rows']
+        for name, (elapsed, size) in results:
+            self.stdout.write(f"{name:32} {elapsed:8.2f} ms  {size / 1024:8.0f} KiB  ({rows} rows)")
+        self.stdout.write(f"renderer speedup: {results[0][1][0] / results[1][1][0]:.1f}x")
+        self.stdout.write(f"JsonResponse speedup: {results[2][1][0] / results[3][1][0]:.1f}x")
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.19 on 2026-10-18 08:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documentation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['date_creation', 'id'], name='document_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=models.Index(fields=['type_document', 'date_creation', 'id'], name='document_type_created_id_idx'),
+        ),
+    ]
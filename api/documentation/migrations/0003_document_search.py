@@ -0,0 +1,53 @@
+# Generated by Django 4.2.19 on 2026-10-18 08:25
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Keeps search_vector current on every write, including bulk_create and
+# bulk_update which bypass model signals. Mirrors Document.search_vector_expression().
+CREATE_TRIGGER = '''
+CREATE FUNCTION documentation_document_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.nom_document, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER documentation_document_search_vector_update
+BEFORE INSERT OR UPDATE OF nom_document, description ON documentation_document
+FOR EACH ROW EXECUTE PROCEDURE documentation_document_search_vector();
+'''
+
+DROP_TRIGGER = '''
+DROP TRIGGER IF EXISTS documentation_document_search_vector_update ON documentation_document;
+DROP FUNCTION IF EXISTS documentation_document_search_vector();
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documentation', '0002_document_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='document',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='document_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='document',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nom_document'], name='document_nom_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
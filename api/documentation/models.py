@@ -1,4 +1,10 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+
+# Text search configuration of Document.search_vector, also used by the
+# trigger that maintains it (see migration 0003)
+SEARCH_CONFIG = 'simple'
 
 class Document(models.Model):
     id = models.CharField(max_length=255, primary_key=True)
@@ -7,6 +13,24 @@ class Document(models.Model):
     type_document = models.CharField(max_length=100)
     date_creation = models.DateField(auto_now_add=True)
     date_modification = models.DateField(auto_now=True)
+    # Exact time of the last write, the validator for conditional reads
+    last_modified = models.DateTimeField(auto_now=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_creation', 'id'], name='document_created_id_idx'),
+            models.Index(fields=['type_document', 'date_creation', 'id'], name='document_type_created_id_idx'),
+            GinIndex(fields=['search_vector'], name='document_search_vector_idx'),
+            GinIndex(fields=['nom_document'], name='document_nom_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+    @staticmethod
+    def search_vector_expression():
+        return (
+            SearchVector('nom_document', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        )
 
     def __str__(self):
         return self.nom_document
@@ -4,4 +4,19 @@ from .models import Document
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = '__all__'  
+        exclude = ['search_vector', 'last_modified']
+
+class BulkDocumentListSerializer(serializers.ListSerializer):
+    def run_child_validation(self, data):
+        # Match each item to its row, loaded for the whole chunk in one query
+        instances = self.context.get('instances')
+        if instances is not None and isinstance(data, dict):
+            self.child.instance = instances.get(str(data.get('id')))
+            self.child.initial_data = data
+        return super().run_child_validation(data)
+
+class BulkDocumentSerializer(DocumentSerializer):
+    """Document serializer for bulk writes, id uniqueness is checked per chunk"""
+    class Meta(DocumentSerializer.Meta):
+        list_serializer_class = BulkDocumentListSerializer
+        extra_kwargs = {'id': {'validators': []}}
@@ -1,3 +1,341 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import AsyncClient, SimpleTestCase, TestCase
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from api.db.pooled_postgresql.base import ConnectionPool
+from api.renderers import FastJSONRenderer, JsonResponse, dumps
+from api.instrumentation import InstrumentationMiddleware, registry
+from asgiref.sync import iscoroutinefunction
+from user.models import UserCustomer
+from .models import Document
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+import base64
+import json
+import uuid
 
 # Create your tests here.
+class DocumentBulkViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = UserCustomer.objects.create_user(username='bulk', password='secret')
+        application = Application.objects.create(
+            name='bulk',
+            user=user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        AccessToken.objects.create(
+            user=user,
+            application=application,
+            token='fresh-token',
+            expires=timezone.now() + timedelta(hours=1)
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer fresh-token')
+
+    def test_ndjson_with_uncached_token(self):
+        body = '\n'.join([
+            '{"id": "1", "nom_document": "Rapport", "description": "d", "type_document": "rapport"}',
+            'not json',
+            '{"id": "2", "nom_document": "Facture", "description": "d", "type_document": "facture"}',
+        ])
+        response = self.client.post('/documentation/document-bulk/', body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual(response.data['processed'], 3)
+        self.assertEqual(response.data['succeeded'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(Document.objects.count(), 2)
+
+    def post(self, *items):
+        return self.client.post('/documentation/document-bulk/', list(items), format='json')
+
+    def document(self, document_id):
+        return {'id': document_id, 'nom_document': 'Rapport', 'type_document': 'rapport'}
+
+    def test_status_follows_the_results(self):
+        response = self.post(self.document('1'), self.document('2'))
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['succeeded'], 2)
+
+        response = self.post(self.document('2'), {'id': '3'})
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertEqual(response.data['succeeded'], 0)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 1])
+
+        response = self.post(self.document('3'), self.document('1'))
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual(response.data['succeeded'], 1)
+        self.assertEqual(response.data['errors'][0]['id'], '1')
+
+    def test_concurrent_insert_is_reported_per_item(self):
+        raced = []
+
+        def insert_after_check(execute, sql, params, many, context):
+            # Another writer takes id 5 between the duplicate check and the insert
+            result = execute(sql, params, many, context)
+            if sql.startswith('SELECT') and 'documentation_document' in sql and not raced:
+                raced.append(sql)
+                Document.objects.create(**self.document('5'))
+            return result
+
+        with connection.execute_wrapper(insert_after_check):
+            response = self.post(self.document('4'), self.document('5'), self.document('6'))
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual(response.data['succeeded'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(set(Document.objects.values_list('id', flat=True)), {'4', '5', '6'})
+
+class DocumentViewTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(UserCustomer.objects.create_user(username='reader'))
+        for i in range(5):
+            Document.objects.create(id=str(i), nom_document=f'Rapport {i}', type_document='rapport')
+
+    def test_page_validator(self):
+        params = {'page_size': 2}
+        with self.assertNumQueries(1):
+            response = self.client.get('/documentation/document-list/', params)
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/documentation/document-list/', params,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Writes outside the page keep it valid, writes inside do not
+        last = response.data['results'][-1]['id']
+        Document.objects.exclude(id__in=[d['id'] for d in response.data['results']]).first().save()
+        self.assertEqual(self.client.get('/documentation/document-list/', params,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Document.objects.get(id=last).save()
+        self.assertEqual(self.client.get('/documentation/document-list/', params,
+                                         HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get('/documentation/document-list/',
+                                       {'page_size': 2, **params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [document['id'] for document in response.data['results']]
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_keyset_walk(self):
+        # Ties on date_creation are broken by id, newest first
+        self.assertEqual(self.walk(), ['4', '3', '2', '1', '0'])
+
+        today = timezone.localdate()
+        Document.objects.filter(id__in=['0', '1']).update(date_creation=today + timedelta(days=1))
+        Document.objects.filter(id='4').update(date_creation=today - timedelta(days=1))
+        self.assertEqual(self.walk(), ['1', '0', '3', '2', '4'])
+        self.assertEqual(self.walk(date_to=today.isoformat()), ['3', '2', '4'])
+
+    def test_bad_cursor(self):
+        # Not base64, too few values, not a date
+        cursors = ['not-base64!'] + [
+            base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            for values in (['1'], ['not-a-date', '1'])
+        ]
+        for cursor in cursors:
+            response = self.client.get('/documentation/document-list/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertIn('cursor', response.data)
+
+class InstrumentationTests(TestCase):
+
+    labels = {'view': 'documentation.views.DocumentView', 'method': 'GET'}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        user = UserCustomer.objects.create_user(username='metrics')
+        application = Application.objects.create(
+            name='metrics',
+            user=user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        AccessToken.objects.create(
+            user=user,
+            application=application,
+            token='metrics-token',
+            expires=timezone.now() + timedelta(hours=1)
+        )
+        Document.objects.create(id='1', nom_document='Rapport', type_document='rapport')
+
+    def observed(self, name):
+        """(count, sum) of the histogram name for the document list"""
+        histogram = registry.histograms.get((name, tuple(sorted(self.labels.items()))))
+        return (sum(histogram.counts), histogram.sum) if histogram else (0, 0)
+
+    def test_request_breakdown_is_recorded(self):
+        before = {name: self.observed(name) for name in
+                  ('http_request_duration_seconds', 'http_request_db_queries', 'http_request_render_seconds')}
+        response = self.client.get('/documentation/document-list/',
+                                   HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, 200)
+
+        count, queries = self.observed('http_request_db_queries')
+        self.assertEqual(count, before['http_request_db_queries'][0] + 1)
+        # The token lookup and the page
+        self.assertGreaterEqual(queries - before['http_request_db_queries'][1], 2)
+        for name in ('http_request_duration_seconds', 'http_request_render_seconds'):
+            count, seconds = self.observed(name)
+            self.assertEqual(count, before[name][0] + 1)
+            self.assertGreater(seconds, before[name][1])
+
+    async def test_async_stack_records_queries(self):
+        async def view(request):
+            pass
+        self.assertTrue(iscoroutinefunction(InstrumentationMiddleware(view)))
+
+        before = self.observed('http_request_db_queries')
+        response = await AsyncClient().get('/documentation/document-list/',
+                                           headers={'Authorization': 'Bearer metrics-token'})
+        self.assertEqual(response.status_code, 200)
+        count, queries = self.observed('http_request_db_queries')
+        self.assertEqual(count, before[0] + 1)
+        self.assertGreaterEqual(queries - before[1], 2)
+
+    def test_metrics_exposition(self):
+        self.client.get('/documentation/document-list/', HTTP_AUTHORIZATION='Bearer metrics-token')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE http_requests_total counter', lines)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        labels = 'method="GET",status="200",view="documentation.views.DocumentView"'
+        self.assertTrue(any(line.startswith(f'http_requests_total{{{labels}}} ') for line in lines))
+        buckets = [line for line in lines if line.startswith(
+            'http_request_duration_seconds_bucket{method="GET",view="documentation.views.DocumentView"'
+        )]
+        self.assertTrue(buckets[-1].split('le=')[1].startswith('"+Inf"'))
+        counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+        self.assertIn('# TYPE db_pool_connections gauge', lines)
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 403)
+
+class FakeConnection:
+    """DB-API connection double recording pings and rollbacks"""
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.closed = False
+        self.pings = 0
+        self.rollbacks = 0
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def execute(self, sql):
+        self.pings += 1
+        if not self.healthy:
+            raise DatabaseError('server closed the connection unexpectedly')
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def pool(self, **options):
+        return ConnectionPool(**{'max_size': 2, 'timeout': 0.05, 'max_lifetime': 60,
+                                 'pre_ping': True, **options})
+
+    def test_released_connections_are_reused_after_a_ping(self):
+        pool = self.pool()
+        first = pool.acquire(FakeConnection)
+        pool.release(first)
+        self.assertEqual(first.rollbacks, 1)
+        self.assertIs(pool.acquire(FakeConnection), first)
+        self.assertEqual(first.pings, 1)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_checkout_waits_for_a_free_slot(self):
+        pool = self.pool()
+        held = [pool.acquire(FakeConnection), pool.acquire(FakeConnection)]
+        with self.assertRaises(DatabaseError):
+            pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        pool.release(held[0])
+        self.assertIs(pool.acquire(FakeConnection), held[0])
+
+    def test_broken_and_old_connections_are_replaced(self):
+        pool = self.pool()
+        broken = pool.acquire(FakeConnection)
+        pool.release(broken)
+        broken.healthy = False
+        replacement = pool.acquire(FakeConnection)
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['ping_failures'], 1)
+
+        pool = self.pool(max_lifetime=0, pre_ping=False)
+        old = pool.acquire(FakeConnection)
+        pool.release(old)
+        self.assertIsNot(pool.acquire(FakeConnection), old)
+        self.assertEqual((old.pings, pool.stats()['recycled']), (0, 1))
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = self.pool(max_size=1)
+
+        def connect():
+            raise DatabaseError('could not connect')
+
+        with self.assertRaises(DatabaseError):
+            pool.acquire(connect)
+        pool.acquire(FakeConnection)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+class JSONRenderingTests(SimpleTestCase):
+
+    data = {
+        'date': date(2026, 10, 18),
+        'datetime': datetime(2026, 10, 18, 12, 30, 45, tzinfo=dt_timezone.utc),
+        'naive': datetime(2026, 10, 18, 12, 30, 45),
+        'amount': Decimal('12.50'),
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        1: 'non-string key',
+        'text': 'line\u2028separator'
+    }
+
+    def test_same_values_as_the_stdlib_encoders(self):
+        self.assertEqual(json.loads(dumps(self.data)), {
+            'date': '2026-10-18',
+            'datetime': '2026-10-18T12:30:45Z',
+            'naive': '2026-10-18T12:30:45',
+            'amount': '12.50',
+            'id': '12345678-1234-5678-1234-567812345678',
+            '1': 'non-string key',
+            'text': 'line\u2028separator'
+        })
+        self.assertEqual(json.loads(FastJSONRenderer().render(self.data)),
+                         json.loads(JSONRenderer().render(self.data)))
+        self.assertEqual(json.loads(JsonResponse(self.data).content), json.loads(dumps(self.data)))
+
+    def test_microseconds_round_trip(self):
+        value = datetime(2026, 10, 18, 12, 30, 45, 123456, tzinfo=dt_timezone.utc)
+        self.assertEqual(parse_datetime(json.loads(dumps({'at': value}))['at']), value)
+
+    def test_output_stays_a_javascript_subset(self):
+        content = FastJSONRenderer().render({'text': self.data['text']})
+        self.assertIn(b'\\u2028', content)
+        self.assertNotIn('\u2028'.encode(), content)
+        with self.assertRaises(TypeError):
+            JsonResponse([1, 2])
@@ -4,6 +4,9 @@ from .import views
 urlpatterns = [
 path('document/',views.DocumentAddView.as_view()),
 path('document-Add/',views.DocumentAddView.as_view()), 
+path('document-list/',views.DocumentView.as_view()),
+path('document-bulk/',views.DocumentBulkView.as_view()),
+path('document-search/',views.DocumentSearchView.as_view()),
 path('document/<int:id>/',views.DocumentDetailView.as_view()) ,
 path('document-update/<int:id>/',views.DocumentUpdateView.as_view()), 
 path('document-Delete/<int:id>/',views.DocumentDeleteView.as_view())   
@@ -1,9 +1,22 @@
 from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Document
+from .models import Document, SEARCH_CONFIG
 from rest_framework import status
-from .serializers import DocumentSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from api.pagination import KeysetPagination
+from api.conditional import ConditionalGetMixin
+from api.parsers import NDJSONParser
+from .serializers import DocumentSerializer, BulkDocumentSerializer
+from itertools import islice
 # Create your views here.
 class DocumentAddView (APIView):
     def post(self, request, *args, **kwargs):
@@ -12,14 +25,57 @@ class DocumentAddView (APIView):
             serializer.save()  
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-class DocumentView (APIView):
+class DocumentView (ConditionalGetMixin, APIView):
+    cache_control = {'public': True, 'max_age': settings.DOCUMENT_CACHE_MAX_AGE}
+    pagination = KeysetPagination(
+        ordering=('-date_creation', '-id'),
+        default_page_size=settings.DOCUMENT_PAGE_SIZE,
+        max_page_size=settings.DOCUMENT_MAX_PAGE_SIZE
+    )
+
+    def get_date(self, request, name):
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({name: 'Use the YYYY-MM-DD format.'})
+        return date
+
+    def filter_queryset(self, request, documents):
+        type_document = request.query_params.get('type_document')
+        if type_document:
+            documents = documents.filter(type_document=type_document)
+        date_from = self.get_date(request, 'date_from')
+        if date_from:
+            documents = documents.filter(date_creation__gte=date_from)
+        date_to = self.get_date(request, 'date_to')
+        if date_to:
+            documents = documents.filter(date_creation__lte=date_to)
+        return documents
+
     def get(self, request, *args, **kwargs):
-        documents = Document.objects.all()
-        serializer = DocumentSerializer(documents, many=True)
-        return Response(serializer.data)
-class DocumentDetailView (APIView):
+        documents = self.filter_queryset(request, Document.objects.all())
+        page, next_cursor = self.pagination.paginate_queryset(documents, request)
+        # The validator covers the page only, so it costs no more than the page
+        not_modified = self.not_modified(
+            request, request.get_full_path(), next_cursor,
+            *((document.id, document.last_modified) for document in page)
+        )
+        if not_modified is not None:
+            return not_modified
+        serializer = DocumentSerializer(page, many=True)
+        return Response({'results': serializer.data, 'next_cursor': next_cursor})
+class DocumentDetailView (ConditionalGetMixin, APIView):
+     cache_control = {'public': True, 'max_age': settings.DOCUMENT_CACHE_MAX_AGE}
+
      def get(self, request, *args, **kwargs):
         id = kwargs.get('id')
+        last_modified = Document.objects.filter(id=id).values_list('last_modified', flat=True).first()
+        if last_modified is not None:
+            not_modified = self.not_modified(request, id, last_modified)
+            if not_modified is not None:
+                return not_modified
         document = Document.objects.get(id=id)
         serializer = DocumentSerializer(document)
         return Response(serializer.data)
@@ -45,4 +101,213 @@ class DocumentDeleteView (APIView):
                 id = kwargs.get('id')
                 document = Document.objects.get(id=id)
                 document.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+                return Response(status=status.HTTP_204_NO_CONTENT)
+class DocumentBulkView (APIView):
+    """Create, update and delete documents from a JSON array or an NDJSON stream
+
+    Items are validated and written in chunks of DOCUMENT_BULK_CHUNK_SIZE,
+    one transaction per chunk, and failures are reported per item index.
+    Partial failures answer 207 and complete failures 400.
+    """
+    parser_classes = [NDJSONParser, *api_settings.DEFAULT_PARSER_CLASSES]
+
+    def iter_items(self, request):
+        if request.content_type.startswith(NDJSONParser.media_type):
+            yield from request.data
+            return
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        yield from request.data
+
+    def iter_chunks(self, request):
+        items = self.iter_items(request)
+        offset = 0
+        while True:
+            chunk = list(islice(items, settings.DOCUMENT_BULK_CHUNK_SIZE))
+            if not chunk:
+                return
+            yield offset, chunk
+            offset += len(chunk)
+
+    def add_error(self, report, index, item, errors):
+        report['errors'].append({
+            'index': index,
+            'id': item.get('id') if isinstance(item, dict) else item,
+            'errors': errors
+        })
+
+    def validate(self, report, indexed, **kwargs):
+        """Validate (index, item) pairs at once, returning (index, item, data) for valid items"""
+        pending = []
+        for index, item in indexed:
+            if isinstance(item, Exception):
+                self.add_error(report, index, None, {'non_field_errors': [str(item)]})
+            else:
+                pending.append((index, item))
+
+        serializer = BulkDocumentSerializer(data=[item for index, item in pending], many=True, **kwargs)
+        if not serializer.is_valid():
+            valid = []
+            for (index, item), errors in zip(pending, serializer.errors):
+                if errors:
+                    self.add_error(report, index, item, errors)
+                else:
+                    valid.append((index, item))
+            pending = valid
+            serializer = BulkDocumentSerializer(data=[item for index, item in pending], many=True, **kwargs)
+            serializer.is_valid(raise_exception=True)
+        return [
+            (index, item, data)
+            for (index, item), data in zip(pending, serializer.validated_data)
+        ]
+
+    def new_report(self):
+        return {'processed': 0, 'succeeded': 0, 'errors': []}
+
+    def finish(self, report, status_code):
+        """status_code when every item succeeded, 207 for mixed results, 400 when none did"""
+        report['errors'].sort(key=lambda error: error['index'])
+        if report['errors']:
+            status_code = status.HTTP_207_MULTI_STATUS if report['succeeded'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=status_code)
+
+    def insert(self, report, documents):
+        """Insert (index, item, document) triples, one at a time if a concurrent insert conflicts"""
+        try:
+            with transaction.atomic():
+                Document.objects.bulk_create([document for index, item, document in documents])
+            report['succeeded'] += len(documents)
+            return
+        except IntegrityError:
+            pass
+        for index, item, document in documents:
+            try:
+                with transaction.atomic():
+                    document.save(force_insert=True)
+                report['succeeded'] += 1
+            except IntegrityError:
+                self.add_error(report, index, item, {'id': ['document with this id already exists.']})
+
+    def post(self, request, *args, **kwargs):
+        """Create documents"""
+        report = self.new_report()
+        for offset, chunk in self.iter_chunks(request):
+            report['processed'] += len(chunk)
+            valid = self.validate(report, enumerate(chunk, offset))
+            existing = set(Document.objects.filter(
+                id__in=[data['id'] for index, item, data in valid]
+            ).values_list('id', flat=True))
+            documents = []
+            for index, item, data in valid:
+                if data['id'] in existing:
+                    self.add_error(report, index, item, {'id': ['document with this id already exists.']})
+                    continue
+                existing.add(data['id'])
+                documents.append((index, item, Document(**data)))
+            # The check above can race with other writers, so conflicts are also caught here
+            self.insert(report, documents)
+        return self.finish(report, status.HTTP_201_CREATED)
+
+    def put(self, request, *args, **kwargs):
+        """Update documents, every field is required"""
+        return self.update(request, partial=False)
+
+    def patch(self, request, *args, **kwargs):
+        """Update the given fields of documents"""
+        return self.update(request, partial=True)
+
+    def update(self, request, partial):
+        report = self.new_report()
+        now = timezone.now()
+        today = timezone.localdate(now)
+        for offset, chunk in self.iter_chunks(request):
+            report['processed'] += len(chunk)
+            instances = Document.objects.in_bulk([
+                str(item['id']) for item in chunk if isinstance(item, dict) and 'id' in item
+            ])
+            known = []
+            for index, item in enumerate(chunk, offset):
+                if isinstance(item, dict) and str(item.get('id')) not in instances:
+                    self.add_error(report, index, item, {'id': ['Document not found.']})
+                else:
+                    known.append((index, item))
+
+            valid = self.validate(report, known, partial=partial, context={'instances': instances})
+
+            documents = []
+            fields = {'date_modification', 'last_modified'}
+            for index, item, data in valid:
+                document = instances[str(item['id'])]
+                for field, value in data.items():
+                    if field != 'id':
+                        setattr(document, field, value)
+                        fields.add(field)
+                document.date_modification = today
+                document.last_modified = now
+                documents.append(document)
+            with transaction.atomic():
+                Document.objects.bulk_update(documents, sorted(fields))
+            report['succeeded'] += len(documents)
+        return self.finish(report, status.HTTP_200_OK)
+
+    def delete(self, request, *args, **kwargs):
+        """Delete documents given their ids"""
+        report = self.new_report()
+        for offset, chunk in self.iter_chunks(request):
+            report['processed'] += len(chunk)
+            ids = {}
+            for index, item in enumerate(chunk, offset):
+                document_id = item.get('id') if isinstance(item, dict) else item
+                if isinstance(document_id, (str, int)):
+                    ids[index] = str(document_id)
+                else:
+                    self.add_error(report, index, None, {'id': ['A document id is required.']})
+            with transaction.atomic():
+                existing = set(Document.objects.filter(
+                    id__in=ids.values()
+                ).select_for_update().values_list('id', flat=True))
+                for index, document_id in ids.items():
+                    if document_id not in existing:
+                        self.add_error(report, index, document_id, {'id': ['Document not found.']})
+                Document.objects.filter(id__in=existing).delete()
+            report['succeeded'] += len(existing)
+        return self.finish(report, status.HTTP_200_OK)
+
+class DocumentSearchView (APIView):
+    """Ranked full-text search on nom_document and description, with fuzzy name matching"""
+    def get(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'This parameter is required.'})
+        try:
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', settings.DOCUMENT_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({'page': 'page and page_size must be integers.'})
+        if page < 1 or not 1 <= page_size <= settings.DOCUMENT_MAX_PAGE_SIZE:
+            raise ValidationError({'page': 'page or page_size out of range.'})
+        start = (page - 1) * page_size
+        if start >= settings.DOCUMENT_SEARCH_MAX_RESULTS:
+            raise ValidationError({'page': 'Refine the query to see further results.'})
+
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+        documents = Document.objects.filter(
+            Q(search_vector=query) | Q(nom_document__trigram_similar=text)
+        ).annotate(
+            score=Greatest(
+                SearchRank(F('search_vector'), query),
+                TrigramSimilarity('nom_document', text)
+            )
+        ).order_by('-score', 'id')
+
+        rows = list(documents[start:start + page_size + 1])
+        serializer = DocumentSerializer(rows[:page_size], many=True)
+        results = [
+            {**data, 'score': row.score}
+            for data, row in zip(serializer.data, rows)
+        ]
+        return Response({
+            'results': results,
+            'page': page,
+            'has_next': len(rows) > page_size
+        })
@@ -0,0 +1,339 @@
+from django.shortcuts import redirect
+from django.conf import settings
+from django.views import View
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.core.handlers.wsgi import WSGIRequest
+from asgiref.sync import sync_to_async
+from googleapiclient.errors import HttpError
+from api.renderers import JsonResponse
+from api.instrumentation import upstream_call
+from .views import GoogleDriveAuth, DrivePermissions, DriveBatch, FileMetadata, FileState, rate_limited
+from .quota import DriveQuota, DriveRateLimited
+from functools import partial
+import asyncio
+import contextvars
+import httplib2
+import httpx
+import json
+import logging
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+_clients = weakref.WeakKeyDictionary()
+_wsgi_request = contextvars.ContextVar('drive_wsgi_request', default=False)
+
+def get_async_client():
+    """Shared pooled HTTP client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=settings.GOOGLE_ASYNC_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.GOOGLE_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GOOGLE_ASYNC_MAX_CONNECTIONS
+            )
+        )
+        _clients[loop] = client
+    return client
+
+class BackgroundLoop:
+    """Process-wide event loop thread sending the upstream calls of WSGI requests
+
+    async_to_sync runs each WSGI request in a new event loop, and an httpx
+    client only works from the loop it was created on, so a client per
+    request loop would open new connections every time. Calls made under
+    WSGI run on this loop instead, sharing its client and connections.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever, name='drive-async-client', daemon=True
+                ).start()
+            return self._loop
+
+    async def run(self, coroutine):
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.get()))
+
+background_loop = BackgroundLoop()
+
+async def fetch(method, uri, content, headers):
+    return await get_async_client().request(method, uri, content=content, headers=headers)
+
+async def send(http_request, credentials):
+    """Send a request built by googleapiclient through the async client"""
+    headers = dict(http_request.headers)
+    headers['Authorization'] = f'Bearer {credentials.token}'
+    call = fetch(http_request.method, http_request.uri, http_request.body, headers)
+    with upstream_call(http_request.methodId):
+        if _wsgi_request.get():
+            response = await background_loop.run(call)
+        else:
+            response = await call
+    if response.status_code >= 300:
+        resp = httplib2.Response({
+            'status': str(response.status_code),
+            'content-type': response.headers.get('content-type', ''),
+            'retry-after': response.headers.get('retry-after', '')
+        })
+        raise HttpError(resp, response.content, uri=http_request.uri)
+    return response.json() if response.content else {}
+
+async def execute(http_request, credentials):
+    """send() within the Drive rate limits, retrying transient failures"""
+    return await DriveQuota.call_async(
+        partial(send, http_request, credentials),
+        credentials,
+        http_request.methodId,
+        idempotent=http_request.method in ('GET', 'HEAD')
+    )
+
+async def gather_results(requests, credentials):
+    """Run independent requests concurrently, returning (response, exception) per request"""
+    results = await asyncio.gather(
+        *[execute(request, credentials) for request in requests],
+        return_exceptions=True
+    )
+    return [
+        (None, result) if isinstance(result, Exception) else (result, None)
+        for result in results
+    ]
+
+def is_owner(file, user_email):
+    return any(owner.get('emailAddress') == user_email
+               for owner in file.get('owners', []))
+
+class AsyncBaseGoogleDriveView(View):
+    """Base class for async Google Drive views"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        token = _wsgi_request.set(isinstance(request, WSGIRequest))
+        try:
+            return await self.dispatch_drive(request, *args, **kwargs)
+        finally:
+            _wsgi_request.reset(token)
+
+    async def dispatch_drive(self, request, *args, **kwargs):
+        self.credentials = await sync_to_async(GoogleDriveAuth.get_credentials)(request)
+        if not self.credentials:
+            return redirect('/drive/auth/')
+
+        try:
+            self.user_email = await sync_to_async(GoogleDriveAuth.get_user_email)(
+                request, self.credentials
+            )
+        except DriveRateLimited as e:
+            return rate_limited(e)
+        except Exception as e:
+            logger.error(f"Error getting user email: {str(e)}")
+            self.user_email = None
+
+        self.service = GoogleDriveAuth.get_service(self.credentials)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except DriveRateLimited as e:
+            return rate_limited(e)
+
+    async def execute(self, http_request):
+        return await execute(http_request, self.credentials)
+
+    async def check_write(self, request, file_id, action):
+        """The sync views' ownership and If-Match check, with a client of the worker thread"""
+        def check():
+            service = GoogleDriveAuth.get_service(self.credentials)
+            return FileState.check_write(service, self.user_email, request, file_id, action)
+        return await sync_to_async(check)()
+
+    async def permission_index(self, file_id):
+        index = {}
+        request = self.service.permissions().list(
+            fileId=file_id,
+            pageSize=100,
+            fields='nextPageToken, permissions(id,emailAddress,role)'
+        )
+        while request is not None:
+            response = await self.execute(request)
+            for perm in response.get('permissions', []):
+                if perm.get('emailAddress'):
+                    index[perm['emailAddress'].lower()] = perm
+            request = self.service.permissions().list_next(request, response)
+        return index
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncDriveListFilesView(AsyncBaseGoogleDriveView):
+    """Handle listing files"""
+
+    async def get(self, request):
+        try:
+            page_size = int(request.GET.get('page_size', settings.GOOGLE_DRIVE_PAGE_SIZE))
+            params = {
+                'pageSize': min(max(page_size, 1), settings.GOOGLE_DRIVE_MAX_PAGE_SIZE),
+                'fields': 'nextPageToken, files(id, name, mimeType, createdTime, owners, shared)',
+                'q': f"'me' in owners or '{self.user_email}' in writers"
+            }
+            if request.GET.get('page_token'):
+                params['pageToken'] = request.GET['page_token']
+            results = await self.execute(self.service.files().list(**params))
+
+            files = results.get('files', [])
+            for file in files:
+                file['user_email'] = self.user_email
+                file['is_owner'] = is_owner(file, self.user_email)
+
+            return JsonResponse({
+                'files': files,
+                'next_page_token': results.get('nextPageToken'),
+                'user_email': self.user_email
+            })
+
+        except DriveRateLimited:
+            raise
+        except Exception as e:
+            logger.error(f"File listing error: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncDriveFileDetailView(AsyncBaseGoogleDriveView):
+    """Handle getting file details"""
+
+    async def get(self, request, file_id):
+        try:
+            file = await self.execute(self.service.files().get(
+                fileId=file_id,
+                fields='id, name, mimeType, createdTime, owners'
+            ))
+
+            return JsonResponse({
+                **file,
+                'user_email': self.user_email,
+                'is_owner': is_owner(file, self.user_email)
+            })
+
+        except DriveRateLimited:
+            raise
+        except Exception as e:
+            logger.error(f"File detail error: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncDriveFileUpdateView(AsyncBaseGoogleDriveView):
+    """Handle file updates"""
+
+    async def get(self, request, file_id):
+        """Get file update form"""
+        try:
+            # Ownership and sharing settings are fetched concurrently
+            file, permissions = await asyncio.gather(
+                self.execute(self.service.files().get(
+                    fileId=file_id,
+                    fields='id, name, mimeType, createdTime, owners'
+                )),
+                self.execute(self.service.permissions().list(
+                    fileId=file_id,
+                    fields='permissions(id,emailAddress,role)'
+                ))
+            )
+
+            if not is_owner(file, self.user_email):
+                return JsonResponse(
+                    {'error': 'You do not have permission to modify this file'},
+                    status=403
+                )
+
+            return JsonResponse({
+                **file,
+                'user_email': self.user_email,
+                'permissions': permissions.get('permissions', [])
+            })
+
+        except DriveRateLimited:
+            raise
+        except Exception as e:
+            logger.error(f"File update form error: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+
+    async def put(self, request, file_id):
+        """Update file"""
+        try:
+            data = json.loads(request.body)
+            share_updates = data.get('share_updates', [])
+            remove_permissions = data.get('remove_permissions', [])
+
+            # Write check and permission snapshot are fetched concurrently
+            lookups = [self.check_write(request, file_id, 'modify')]
+            if share_updates or remove_permissions:
+                lookups.append(self.permission_index(file_id))
+            error, *index = await asyncio.gather(*lookups)
+            if error:
+                return error
+            await sync_to_async(FileMetadata.forget)(self.user_email, file_id)
+
+            changes = []
+            if index:
+                changes = DrivePermissions.diff(index[0], share_updates, remove_permissions)
+            requests = [
+                DrivePermissions.request(self.service, file_id, change)
+                for change in changes
+            ]
+            requests.append(self.service.files().update(
+                fileId=file_id,
+                body={
+                    'name': data.get('name'),
+                    'description': data.get('description', '')
+                },
+                fields=FileMetadata.FIELDS
+            ))
+
+            # Permission changes and the metadata update are independent
+            *results, (updated_file, error) = await gather_results(requests, self.credentials)
+            if error:
+                raise error
+            await sync_to_async(FileMetadata.updated)(self.user_email, updated_file)
+
+            response = JsonResponse({
+                'message': 'File updated successfully',
+                'file': updated_file,
+                'permission_results': DriveBatch.report(changes, results),
+                'owner_email': self.user_email
+            })
+            response['ETag'] = FileState.etag(updated_file['version'])
+            return response
+
+        except DriveRateLimited:
+            raise
+        except Exception as e:
+            logger.error(f"File update error: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncDriveFileDeleteView(AsyncBaseGoogleDriveView):
+    """Handle file deletion"""
+
+    async def delete(self, request, file_id):
+        try:
+            error = await self.check_write(request, file_id, 'delete')
+            if error:
+                return error
+
+            await self.execute(self.service.files().delete(fileId=file_id))
+            await sync_to_async(FileMetadata.deleted)(self.user_email, file_id)
+            return JsonResponse({
+                'message': 'File deleted successfully',
+                'owner_email': self.user_email
+            })
+
+        except DriveRateLimited:
+            raise
+        except Exception as e:
+            logger.error(f"File deletion error: {str(e)}")
+            return JsonResponse({'error': str(e)}, status=500)
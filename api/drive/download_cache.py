@@ -0,0 +1,209 @@
+"""Content-addressed disk cache of Drive downloads
+
+Files are stored under GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR by a hash of their id
+and md5Checksum (version for files without one), so a changed file never
+matches an old entry. Hits are served with FileResponse, which lets the WSGI
+server use sendfile. A miss starts one background fill per file and every
+reader in the process, the first one included, streams the partially
+written file as it grows. Least recently used entries are evicted once the
+cache grows past GOOGLE_DRIVE_DOWNLOAD_CACHE_SIZE bytes.
+"""
+from django.conf import settings
+from api.instrumentation import registry
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Fill:
+    """A file being written into the cache, followed by its readers"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.part = f'{path}.part'
+        self.size = size
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    def advance(self, written=0, done=False, failed=False):
+        with self.condition:
+            self.written += written
+            self.done = self.done or done
+            self.failed = self.failed or failed
+            self.condition.notify_all()
+
+    def open(self):
+        try:
+            return open(self.part, 'rb')
+        except FileNotFoundError:
+            # Already complete and renamed
+            return open(self.path, 'rb')
+
+    def stream(self, chunk_size):
+        """Yield the content as it is written, waiting for the filler when caught up"""
+        with self.open() as fh:
+            offset = 0
+            while True:
+                with self.condition:
+                    while self.written <= offset and not self.done:
+                        self.condition.wait()
+                    written, done, failed = self.written, self.done, self.failed
+                if failed:
+                    raise OSError(f"Drive download into {self.path} failed")
+                if offset >= written and done:
+                    return
+                chunk = fh.read(min(chunk_size, written - offset))
+                offset += len(chunk)
+                yield chunk
+
+
+class DownloadCache:
+    """Process-wide registry of the fills in progress over the shared cache directory
+
+    Fills are single-flight within a process. Across processes the .part
+    file is created exclusively, and a process finding another one filling
+    a file streams from Drive without caching.
+    """
+
+    # A .part file left untouched this long belongs to a dead filler
+    STALE_FILL = 60
+
+    def __init__(self):
+        self._fills = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(file_id, file):
+        """Cache key of a file resource read with size, md5Checksum and version, None if not cacheable"""
+        tag = file.get('md5Checksum') or file.get('version')
+        size = file.get('size')
+        if (settings.GOOGLE_DRIVE_DOWNLOAD_CACHE_SIZE is None or tag is None or size is None
+                or int(size) > settings.GOOGLE_DRIVE_DOWNLOAD_CACHE_MAX_FILE_SIZE):
+            return None
+        return hashlib.sha256(f'{file_id}:{tag}'.encode()).hexdigest()
+
+    @staticmethod
+    def path(key):
+        return os.path.join(settings.GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR, key[:2], key)
+
+    def open(self, key):
+        """The cached file opened for reading, None on a miss"""
+        path = self.path(key)
+        try:
+            fh = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        # Reading counts as a use for the LRU order
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return fh
+
+    def join(self, key):
+        """The fill of key in progress in this process, None if there is none"""
+        with self._lock:
+            return self._fills.get(key)
+
+    def claim(self, part):
+        try:
+            return os.open(part, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass
+        try:
+            if time.time() - os.path.getmtime(part) < self.STALE_FILL:
+                return None
+            os.remove(part)
+            return os.open(part, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except (FileNotFoundError, FileExistsError):
+            return None
+
+    def fill(self, key, upstream, session, size):
+        """Write the upstream response into the cache in the background
+
+        Returns the Fill to stream from, None if another process is filling
+        key. The upstream response and its session are closed by the fill,
+        or right away if this process was already filling key.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            fill = self._fills.get(key)
+            fd = None if fill is not None else self.claim(f'{path}.part')
+            if fd is not None:
+                fill = self._fills[key] = Fill(path, size)
+        if fd is None:
+            if fill is not None:
+                upstream.close()
+                session.close()
+            return fill
+
+        threading.Thread(
+            target=self.run,
+            args=(key, fill, fd, upstream, session),
+            daemon=True
+        ).start()
+        return fill
+
+    def run(self, key, fill, fd, upstream, session):
+        try:
+            with open(fd, 'wb') as fh:
+                for chunk in upstream.iter_content(chunk_size=settings.GOOGLE_DRIVE_DOWNLOAD_CHUNK_SIZE):
+                    fh.write(chunk)
+                    # Readers follow the file through their own descriptors
+                    fh.flush()
+                    fill.advance(len(chunk))
+            if fill.written != fill.size:
+                raise OSError(f"expected {fill.size} bytes, got {fill.written}")
+            os.replace(fill.part, fill.path)
+        except Exception as e:
+            logger.error(f"Download cache fill error: {str(e)}")
+            try:
+                os.remove(fill.part)
+            except OSError:
+                pass
+            fill.advance(failed=True)
+        finally:
+            upstream.close()
+            session.close()
+            with self._lock:
+                self._fills.pop(key, None)
+            fill.advance(done=True)
+        if not fill.failed:
+            self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits its size"""
+        entries = []
+        total = 0
+        for directory, _, names in os.walk(settings.GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR):
+            for name in names:
+                if name.endswith('.part'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= settings.GOOGLE_DRIVE_DOWNLOAD_CACHE_SIZE:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            registry.increment('drive_download_cache_evictions_total', {})
+
+
+download_cache = DownloadCache()
@@ -0,0 +1,426 @@
+"""In-process stand-in for the Google Drive v3 and OAuth2 APIs
+
+Used by the benchmark commands and tests so the drive views can be
+measured without talking to Google. Latency, jitter and errors can be
+injected to see how the views behave against a slow or failing upstream.
+"""
+from collections import Counter, namedtuple
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+
+FakeResponse = namedtuple('FakeResponse', 'status headers content')
+
+ERROR_REASONS = {
+    403: 'userRateLimitExceeded',
+    404: 'notFound',
+    429: 'rateLimitExceeded',
+    500: 'backendError',
+    503: 'backendError',
+}
+
+
+class FakeDrive:
+    """In-memory Drive state and request routing
+
+    latency and jitter delay every HTTP request by latency plus up to
+    jitter seconds. error_rate fails that fraction of calls with
+    error_status, and fail() queues errors for calls matching a route.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500,
+                 user_email='owner@example.com', seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.user_email = user_email
+        self.base_url = ''
+        self.random = random.Random(seed)
+        self.files = {}
+        self.changes = []
+        self.uploads = {}
+        self.failures = []
+        self.calls = Counter()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.routes = [
+            ('GET', r'/oauth2/v2/userinfo', self.userinfo),
+            ('POST', r'/token', self.issue_token),
+            ('POST', r'/upload/drive/v3/files', self.start_upload),
+            ('PUT', r'/upload/drive/v3/files', self.upload_chunk),
+            ('GET', r'/drive/v3/files', self.list_files),
+            ('POST', r'/drive/v3/files', self.create_file),
+            ('GET', r'/drive/v3/files/(?P<file_id>[^/]+)', self.get_file_resource),
+            ('PATCH', r'/drive/v3/files/(?P<file_id>[^/]+)', self.update_file),
+            ('DELETE', r'/drive/v3/files/(?P<file_id>[^/]+)', self.delete_file),
+            ('GET', r'/drive/v3/changes/startPageToken', self.get_start_page_token),
+            ('GET', r'/drive/v3/changes', self.list_changes),
+            ('POST', r'/drive/v3/files/(?P<file_id>[^/]+)/permissions', self.create_permission),
+            ('GET', r'/drive/v3/files/(?P<file_id>[^/]+)/permissions', self.list_permissions),
+            ('PATCH', r'/drive/v3/files/(?P<file_id>[^/]+)/permissions/(?P<permission_id>[^/]+)',
+             self.update_permission),
+            ('DELETE', r'/drive/v3/files/(?P<file_id>[^/]+)/permissions/(?P<permission_id>[^/]+)',
+             self.delete_permission),
+        ]
+
+    def add_file(self, file_id, name='Untitled', owner='owner@example.com', content=b'', **fields):
+        now = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+        with self.lock:
+            self.files[file_id] = {
+                'id': file_id,
+                'name': name,
+                'mimeType': 'application/octet-stream',
+                'createdTime': now,
+                'modifiedTime': now,
+                'owners': [{'emailAddress': owner}],
+                'permissions': {},
+                'version': '1',
+                'size': str(len(content)),
+                'content': content,
+                **fields
+            }
+            self.changes.append((file_id, False))
+        return self.files[file_id]
+
+    def remove_file(self, file_id):
+        with self.lock:
+            self.files.pop(file_id, None)
+            self.changes.append((file_id, True))
+
+    def get_file(self, file_id):
+        file = self.files.get(file_id)
+        if file is None:
+            raise FakeDriveError(404, 'notFound', f'File not found: {file_id}')
+        return file
+
+    def fail(self, method, pattern, status=500, times=1):
+        """Fail the next calls whose method and path match"""
+        with self.lock:
+            self.failures.append([method, pattern, status, times])
+
+    def delay(self):
+        return self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def injected_error(self, method, path):
+        with self.lock:
+            for failure in self.failures:
+                failure_method, pattern, status, times = failure
+                if failure_method == method and re.fullmatch(pattern, path):
+                    if times <= 1:
+                        self.failures.remove(failure)
+                    else:
+                        failure[3] -= 1
+                    break
+            else:
+                if not self.error_rate or self.random.random() >= self.error_rate:
+                    return None
+                status = self.error_status
+        reason = ERROR_REASONS.get(status, 'backendError')
+        return FakeDriveError(status, reason, f'Injected {reason} for {method} {path}')
+
+    def dispatch(self, method, path, query, body, headers=None):
+        with self.lock:
+            self.calls[f'{method} {path}'] += 1
+        error = self.injected_error(method, path)
+        if error is not None:
+            return error.status, error.to_dict()
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                try:
+                    return 200, handler(query=query, body=body, headers=headers or {},
+                                        **match.groupdict())
+                except FakeDriveError as e:
+                    return e.status, e.to_dict()
+        return 404, FakeDriveError(404, 'notFound', f'No route for {method} {path}').to_dict()
+
+    def userinfo(self, query, body, headers):
+        return {'id': '1', 'email': self.user_email, 'verified_email': True}
+
+    def issue_token(self, query, body, headers):
+        return {
+            'access_token': f'fake-{uuid.uuid4().hex}',
+            'expires_in': 3600,
+            'token_type': 'Bearer'
+        }
+
+    def start_upload(self, query, body, headers):
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {
+                'metadata': body if isinstance(body, dict) else {},
+                'mime_type': headers.get('X-Upload-Content-Type', 'application/octet-stream'),
+                'data': bytearray()
+            }
+        location = f'{self.base_url}upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}'
+        return FakeResponse(200, {'Location': location}, b'')
+
+    def upload_chunk(self, query, body, headers):
+        upload = self.uploads.get(query.get('upload_id'))
+        if upload is None:
+            raise FakeDriveError(404, 'notFound', 'Upload session not found')
+        match = re.fullmatch(r'bytes (?:(\d+)-\d+|\*)/(\d+|\*)', headers.get('Content-Range', ''))
+        if match is None:
+            raise FakeDriveError(400, 'badContent', 'Missing or invalid Content-Range')
+        start, total = match.groups()
+        with self.lock:
+            if start is not None and int(start) == len(upload['data']):
+                upload['data'] += body if isinstance(body, bytes) else b''
+            received = len(upload['data'])
+        if total == '*' or received < int(total):
+            return FakeResponse(308, {'Range': f'bytes=0-{received - 1}'} if received else {}, b'')
+
+        self.uploads.pop(query['upload_id'], None)
+        file_id = uuid.uuid4().hex
+        file = self.add_file(
+            file_id,
+            **{'name': 'Untitled', 'owner': self.user_email, 'mimeType': upload['mime_type'],
+               **upload['metadata']},
+            content=bytes(upload['data'])
+        )
+        return self.public(file)
+
+    def download(self, file, headers):
+        content = file['content']
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', headers.get('Range', ''))
+        if match is None:
+            return FakeResponse(200, {'Content-Type': file['mimeType']}, content)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(content) - 1), len(content) - 1)
+        if start > end:
+            raise FakeDriveError(416, 'requestedRangeNotSatisfiable', 'Invalid range')
+        return FakeResponse(206, {
+            'Content-Type': file['mimeType'],
+            'Content-Range': f'bytes {start}-{end}/{len(content)}'
+        }, content[start:end + 1])
+
+    def list_files(self, query, body, headers):
+        files = [self.public(file) for file in self.files.values()]
+        page_size = int(query.get('pageSize', 100))
+        start = int(query.get('pageToken', 0))
+        result = {'files': files[start:start + page_size]}
+        if start + page_size < len(files):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+    def create_file(self, query, body, headers):
+        fields = {'name': 'Untitled', 'owner': self.user_email, **body}
+        return self.public(self.add_file(uuid.uuid4().hex, **fields))
+
+    def get_file_resource(self, file_id, query, body, headers):
+        if query.get('alt') == 'media':
+            return self.download(self.get_file(file_id), headers)
+        return self.public(self.get_file(file_id))
+
+    def update_file(self, file_id, query, body, headers):
+        with self.lock:
+            file = self.get_file(file_id)
+            file.update(body)
+            file['version'] = str(int(file['version']) + 1)
+            file['modifiedTime'] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+            self.changes.append((file_id, False))
+        return self.public(file)
+
+    def delete_file(self, file_id, query, body, headers):
+        self.get_file(file_id)
+        self.remove_file(file_id)
+        return None
+
+    def get_start_page_token(self, query, body, headers):
+        return {'startPageToken': str(len(self.changes))}
+
+    def list_changes(self, query, body, headers):
+        page_size = int(query.get('pageSize', 100))
+        start = int(query['pageToken'])
+        result = {'changes': [
+            {'fileId': file_id, 'removed': True} if removed or file_id not in self.files
+            else {'fileId': file_id, 'removed': False, 'file': self.public(self.files[file_id])}
+            for file_id, removed in self.changes[start:start + page_size]
+        ]}
+        if start + page_size < len(self.changes):
+            result['nextPageToken'] = str(start + page_size)
+        else:
+            result['newStartPageToken'] = str(len(self.changes))
+        return result
+
+    @staticmethod
+    def public(file):
+        return {key: value for key, value in file.items() if key not in ('permissions', 'content')}
+
+    def create_permission(self, file_id, query, body, headers):
+        permission = {
+            'kind': 'drive#permission',
+            'id': uuid.uuid4().hex,
+            'type': body.get('type', 'user'),
+            'role': body.get('role', 'reader'),
+            'emailAddress': body.get('emailAddress')
+        }
+        with self.lock:
+            self.get_file(file_id)['permissions'][permission['id']] = permission
+        return permission
+
+    def list_permissions(self, file_id, query, body, headers):
+        permissions = list(self.get_file(file_id)['permissions'].values())
+        page_size = int(query.get('pageSize', 100))
+        start = int(query.get('pageToken', 0))
+        result = {'permissions': permissions[start:start + page_size]}
+        if start + page_size < len(permissions):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+    def update_permission(self, file_id, permission_id, query, body, headers):
+        with self.lock:
+            permission = self.get_file(file_id)['permissions'].get(permission_id)
+            if permission is None:
+                raise FakeDriveError(404, 'notFound', f'Permission not found: {permission_id}')
+            permission['role'] = body.get('role', permission['role'])
+        return permission
+
+    def delete_permission(self, file_id, permission_id, query, body, headers):
+        with self.lock:
+            permissions = self.get_file(file_id)['permissions']
+            if permissions.pop(permission_id, None) is None:
+                raise FakeDriveError(404, 'notFound', f'Permission not found: {permission_id}')
+        return None
+
+
+class FakeDriveError(Exception):
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+    def to_dict(self):
+        return {'error': {
+            'code': self.status,
+            'message': self.message,
+            'errors': [{'reason': self.reason, 'message': self.message}]
+        }}
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_any(self):
+        drive = self.server.drive
+        drive.count_request()
+        delay = drive.delay()
+        if delay:
+            time.sleep(delay)
+
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        url = urlparse(self.path)
+        if url.path.startswith('/batch/'):
+            content_type, payload = self.run_batch(body)
+            return self.reply(200, content_type, payload)
+
+        if 'json' in self.headers.get('Content-Type', 'application/json'):
+            try:
+                body = self.parse_body(body)
+            except ValueError:
+                # Upload chunks are sent without a Content-Type
+                pass
+        status, result = drive.dispatch(self.command, url.path, self.parse_query(url.query),
+                                        body, self.headers)
+        if isinstance(result, FakeResponse):
+            return self.reply(result.status, result.headers.get('Content-Type', 'application/json'),
+                              result.content, result.headers)
+        self.reply(status, 'application/json', json.dumps(result).encode() if result else b'')
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_any
+
+    @staticmethod
+    def parse_query(query):
+        return {key: values[-1] for key, values in parse_qs(query).items()}
+
+    @staticmethod
+    def parse_body(body):
+        return json.loads(body) if body.strip() else {}
+
+    def run_batch(self, body):
+        message = BytesParser().parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body
+        )
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, target, _ = request_line.split(' ', 2)
+            _, _, part_body = rest.replace('\r\n', '\n').partition('\n\n')
+            url = urlparse(target)
+            status, result = self.server.drive.dispatch(
+                method, url.path, self.parse_query(url.query), self.parse_body(part_body)
+            )
+            payload = json.dumps(result) if result else ''
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {self.responses.get(status, ('',))[0]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n"
+                f"{payload}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return f'multipart/mixed; boundary={boundary}', ''.join(parts).encode()
+
+    def reply(self, status, content_type, payload, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            if name != 'Content-Type':
+                self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    """Serve a FakeDrive on a local port from a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self, drive=None, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeDriveHandler)
+        self.drive = drive or FakeDrive()
+        self.drive.base_url = self.url
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def document(self, base_document):
+        """Copy of a discovery document pointing at this server"""
+        document = copy.deepcopy(base_document)
+        document['rootUrl'] = self.url
+        document.pop('mtlsRootUrl', None)
+        return document
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,330 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import override_settings
+from django.utils import timezone
+from google.oauth2.credentials import Credentials
+from oauth2_provider.models import AccessToken, Application
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from documentation.models import Document
+from user.models import UserCustomer
+from drive.fake_drive import FakeDrive, FakeDriveServer
+from drive.views import credential_store, service_cache
+import httpx
+import itertools
+import json
+import math
+import resource
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+
+USER_EMAIL = 'bench@example.com'
+
+
+class QuietHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    help = ('Load-test every drive, documentation and user endpoint against a local '
+            'fake Drive, reporting latency percentiles, throughput, upstream calls and '
+            'peak RSS, optionally saving or comparing a baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='1,8',
+                            help='Comma-separated concurrency levels')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per scenario and concurrency level')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--only', default='',
+                            help='Run only scenarios whose name contains this text')
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help='Simulated upstream round-trip in seconds')
+        parser.add_argument('--jitter', type=float, default=0.0)
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of upstream calls failing with a 503')
+        parser.add_argument('--files', type=int, default=200)
+        parser.add_argument('--documents', type=int, default=1000)
+        parser.add_argument('--save', help='Write the results to this baseline file')
+        parser.add_argument('--compare', help='Fail on regressions against this baseline file')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown before a comparison fails')
+        parser.add_argument('--rate-limits', action='store_true',
+                            help='Keep the Drive rate limits, which a single bench user soon reaches')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the test database between runs')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        drive = FakeDrive(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            error_status=503,
+            user_email=USER_EMAIL,
+            seed=0
+        )
+        # Start from an empty download cache so runs stay comparable
+        cache_dir = tempfile.mkdtemp()
+        overrides = {'GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR': cache_dir}
+        if not options['rate_limits']:
+            overrides.update(GOOGLE_DRIVE_USER_RATE=None, GOOGLE_DRIVE_PROJECT_RATE=None)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb']
+        )
+        try:
+            with override_settings(**overrides), FakeDriveServer(drive) as fake:
+                for api, version in (('drive', 'v3'), ('oauth2', 'v2')):
+                    service_cache.set_document(
+                        api, version, fake.document(service_cache.get_document(api, version))
+                    )
+                self.prepare(drive, fake, options)
+                results = self.run_all(drive, levels, options)
+        finally:
+            service_cache.clear()
+            credential_store.clear()
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump({'options': {key: options[key] for key in (
+                    'requests', 'latency', 'jitter', 'error_rate', 'files', 'documents'
+                )}, 'results': results}, fh, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline saved to {options['save']}")
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def prepare(self, drive, fake, options):
+        """Create the accounts, documents and Drive files every scenario reads"""
+        self.user = UserCustomer.objects.create_user(
+            username='bench', email=USER_EMAIL, is_staff=True
+        )
+        application = Application.objects.create(
+            name='bench',
+            user=self.user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        self.bearer = secrets.token_urlsafe(32)
+        AccessToken.objects.create(
+            user=self.user,
+            application=application,
+            token=self.bearer,
+            expires=timezone.now() + timedelta(hours=1)
+        )
+        Document.objects.bulk_create([
+            Document(
+                id=str(i),
+                nom_document=f'Rapport {i}',
+                description=f'Rapport trimestriel des opérations {i}',
+                type_document=('facture', 'contrat', 'rapport')[i % 3]
+            )
+            for i in range(options['documents'])
+        ])
+        self.documents = options['documents']
+        content = bytes(range(256)) * 256
+        for i in range(options['files']):
+            drive.add_file(f'file-{i}', name=f'File {i}', owner=USER_EMAIL, content=content)
+        self.files = options['files']
+
+        token = credential_store.create(Credentials(
+            token='bench-token',
+            refresh_token='bench-refresh',
+            token_uri=f'{fake.url}token',
+            client_id='bench',
+            client_secret='bench',
+            expiry=datetime.utcnow() + timedelta(hours=6)
+        ), None, None)
+        response = HttpResponse()
+        credential_store.set_cookie(response, token.id)
+        self.cookie = response.cookies[credential_store.cookie_name].value
+        self.upload = content[:16 * 1024]
+        self.ids = itertools.count(1_000_000)
+
+    def scenarios(self, drive):
+        """(name, callable(client, i)) for every endpoint"""
+        def file_id(i):
+            return f'file-{i % self.files}'
+
+        def document_id(i):
+            return i % self.documents
+
+        def drive_file(client, i, path):
+            new_id = f'bench-{next(self.ids)}'
+            drive.add_file(new_id, owner=USER_EMAIL)
+            return client.delete(path.format(new_id))
+
+        def new_document(client, i):
+            document = str(next(self.ids))
+            Document.objects.create(id=document, nom_document='Temporaire', type_document='rapport')
+            return client.delete(f'/documentation/document-Delete/{document}/')
+
+        def new_user(client, i):
+            user = UserCustomer.objects.create_user(username=f'bench-{next(self.ids)}')
+            return client.delete(f'/user/user-delete/{user.id}/')
+
+        def update(path):
+            return lambda client, i: client.put(path.format(file_id(i)), json={
+                'name': f'Renamed {i}',
+                'share_updates': [{'email': f'reader{i % 5}@example.com', 'role': 'reader'}]
+            })
+
+        return [
+            ('drive list', lambda client, i: client.get('/drive/list/', params={'page_size': 50})),
+            ('drive list mirror', lambda client, i: client.get(
+                '/drive/list/', params={'page_size': 50, 'max_age': 60})),
+            ('drive detail', lambda client, i: client.get(f'/drive/file/{file_id(i)}/')),
+            ('drive update form', lambda client, i: client.get(f'/drive/update/{file_id(i)}/')),
+            ('drive update', update('/drive/update/{}/')),
+            ('drive create', lambda client, i: client.post(
+                '/drive/create/', data={'name': f'upload-{i}'},
+                files={'file': ('upload.bin', self.upload, 'application/octet-stream')})),
+            ('drive download', lambda client, i: client.get(f'/drive/download/{file_id(i)}/')),
+            ('drive delete', lambda client, i: drive_file(client, i, '/drive/delete/{}/')),
+            ('drive async list', lambda client, i: client.get(
+                '/drive/async/list/', params={'page_size': 50})),
+            ('drive async detail', lambda client, i: client.get(f'/drive/async/file/{file_id(i)}/')),
+            ('drive async update', update('/drive/async/update/{}/')),
+            ('drive async delete', lambda client, i: drive_file(client, i, '/drive/async/delete/{}/')),
+            ('documentation add', lambda client, i: client.post('/documentation/document/', json={
+                'id': str(next(self.ids)), 'nom_document': f'Nouveau {i}', 'type_document': 'contrat'
+            })),
+            ('documentation list', lambda client, i: client.get(
+                '/documentation/document-list/', params={'page_size': 50})),
+            ('documentation detail', lambda client, i: client.get(
+                f'/documentation/document/{document_id(i)}/')),
+            ('documentation update', lambda client, i: client.patch(
+                f'/documentation/document-update/{document_id(i)}/', json={'description': f'v{i}'})),
+            ('documentation search', lambda client, i: client.get(
+                '/documentation/document-search/', params={'q': f'rapport {i % 50}'})),
+            ('documentation bulk', lambda client, i: client.post('/documentation/document-bulk/', json=[
+                {'id': str(next(self.ids)), 'nom_document': 'Lot', 'type_document': 'facture'}
+                for _ in range(50)
+            ])),
+            ('documentation delete', new_document),
+            ('user add', lambda client, i: client.post('/user/user-add/', json={
+                'username': f'user-{next(self.ids)}', 'password': 'bench-password'
+            })),
+            ('user list', lambda client, i: client.get('/user/user-list/', params={'page_size': 50})),
+            ('user detail', lambda client, i: client.get(f'/user/user-detail/{self.user.id}/')),
+            ('user update', lambda client, i: client.patch(
+                f'/user/user-update/{self.user.id}/', json={'description': f'v{i}'})),
+            ('user delete', new_user),
+        ]
+
+    def run_all(self, drive, levels, options):
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address[:2]
+        self.base_url = f'http://{host}:{port}'
+
+        results = {}
+        try:
+            for name, call in self.scenarios(drive):
+                if options['only'] not in name:
+                    continue
+                self.measure(drive, call, options['warmup'], 1)
+                for level in levels:
+                    results[f'{name}@{level}'] = self.measure(drive, call, options['requests'], level)
+                    self.stdout.write(f"{name} @ {level} done")
+        finally:
+            server.shutdown()
+            server.server_close()
+        return results
+
+    def client(self):
+        return httpx.Client(
+            base_url=self.base_url,
+            headers={'Authorization': f'Bearer {self.bearer}'},
+            cookies={credential_store.cookie_name: self.cookie},
+            timeout=60
+        )
+
+    def measure(self, drive, call, count, concurrency):
+        latencies = []
+        errors = []
+
+        def worker(offset):
+            try:
+                with self.client() as client:
+                    for i in range(offset, count, concurrency):
+                        start = time.perf_counter()
+                        response = call(client, i)
+                        latencies.append(time.perf_counter() - start)
+                        if response.status_code >= 400:
+                            errors.append(response.status_code)
+            finally:
+                # Fixtures created by the scenarios open a connection per thread
+                connections.close_all()
+
+        upstream = drive.requests
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return {
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'throughput': count / elapsed,
+            'upstream_per_request': (drive.requests - upstream) / count,
+            'errors': len(errors),
+            # ru_maxrss is in KiB on Linux, for the whole process including the fake
+            'peak_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f"{'scenario':32} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} "
+            f"{'upstream':>9} {'errors':>6} {'rss MiB':>8}"
+        )
+        for key, result in results.items():
+            self.stdout.write(
+                f"{key:32} {result['p50_ms']:8.1f} {result['p95_ms']:8.1f} {result['p99_ms']:8.1f} "
+                f"{result['throughput']:8.1f} {result['upstream_per_request']:9.2f} "
+                f"{result['errors']:6d} {result['peak_rss_mib']:8.0f}"
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as fh:
+            baseline = json.load(fh)['results']
+
+        regressions = []
+        for key, base in baseline.items():
+            result = results.get(key)
+            if result is None:
+                continue
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{key}: p95 {base['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+            if result['throughput'] < base['throughput'] * (1 - tolerance):
+                regressions.append(
+                    f"{key}: throughput {base['throughput']:.1f} -> {result['throughput']:.1f} req/s"
+                )
+            if result['upstream_per_request'] > base['upstream_per_request'] + 0.05:
+                regressions.append(
+                    f"{key}: upstream calls {base['upstream_per_request']:.2f} -> "
+                    f"{result['upstream_per_request']:.2f} per request"
+                )
+            if result['errors'] > base['errors']:
+                regressions.append(f"{key}: errors {base['errors']} -> {result['errors']}")
+
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(f"No regressions against {path}")
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from googleapiclient.discovery import build_from_document
+from drive.fake_drive import FakeDrive, FakeDriveServer
+from drive.views import DriveBatch, service_cache
+import httplib2
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare serial and batched permission grants against a local fake Drive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emails', type=int, default=50)
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Simulated upstream round-trip in seconds')
+
+    def handle(self, *args, **options):
+        emails = [f'user{i}@example.com' for i in range(options['emails'])]
+        drive = FakeDrive(latency=options['latency'])
+        drive.add_file('serial')
+        drive.add_file('batched')
+
+        with FakeDriveServer(drive) as server:
+            service = build_from_document(
+                server.document(service_cache.get_document('drive', 'v3')),
+                http=httplib2.Http()
+            )
+
+            def grant(file_id, email):
+                return service.permissions().create(
+                    fileId=file_id,
+                    body={'type': 'user', 'role': 'writer', 'emailAddress': email}
+                )
+
+            start = time.perf_counter()
+            for email in emails:
+                grant('serial', email).execute()
+            serial = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = DriveBatch.execute(service, [grant('batched', email) for email in emails])
+            batched = time.perf_counter() - start
+
+        failures = sum(1 for response, exception in results if exception)
+        self.stdout.write(f"serial:  {serial * 1000:.1f} ms for {len(emails)} grants")
+        self.stdout.write(f"batched: {batched * 1000:.1f} ms for {len(emails)} grants ({failures} failed)")
+        self.stdout.write(f"speedup: {serial / batched:.1f}x")
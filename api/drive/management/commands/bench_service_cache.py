@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from drive.views import ServiceClientCache
+import itertools
+import time
+
+
+class Command(BaseCommand):
+    help = 'Compare building Google API clients per request against the service cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--users', type=int, default=10)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        users = [Credentials(token=f'bench-{i}') for i in range(options['users'])]
+
+        def per_request(get_client):
+            start = time.perf_counter()
+            for i in range(count):
+                credentials = users[i % len(users)]
+                get_client('oauth2', 'v2', credentials)
+                get_client('drive', 'v3', credentials)
+            return (time.perf_counter() - start) / count * 1000
+
+        uncached = per_request(
+            lambda api, version, credentials: build(api, version, credentials=credentials)
+        )
+        cache = ServiceClientCache()
+        rotation = itertools.count()
+        cold = per_request(
+            lambda api, version, credentials: cache.get(
+                api, version, Credentials(token=f'rotated-{next(rotation)}')
+            )
+        )
+        warm = per_request(cache.get)
+
+        self.stdout.write(f"build() per request:          {uncached:.3f} ms")
+        self.stdout.write(f"cached document, new token:   {cold:.3f} ms")
+        self.stdout.write(f"cached client, same token:    {warm:.3f} ms")
+        self.stdout.write(f"saving per request:           {uncached - warm:.3f} ms")
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from drive.models import DriveUpload
+from datetime import timedelta
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Delete uploads not completed within GOOGLE_DRIVE_UPLOAD_EXPIRY and their spooled files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.GOOGLE_DRIVE_UPLOAD_EXPIRY,
+                            help='Seconds since the last progress after which an upload is dropped')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['older_than'])
+        stale = DriveUpload.objects.exclude(status=DriveUpload.STATUS_DONE).filter(
+            date_modification__lt=cutoff
+        )
+        removed = 0
+        for upload in stale.iterator():
+            self.remove(upload.path)
+            upload.delete()
+            removed += 1
+
+        # Files spooled by a request that failed before saving its upload
+        orphans = 0
+        if os.path.isdir(settings.GOOGLE_DRIVE_UPLOAD_DIR):
+            known = {str(upload_id) for upload_id in DriveUpload.objects.values_list('id', flat=True)}
+            for entry in os.scandir(settings.GOOGLE_DRIVE_UPLOAD_DIR):
+                if (entry.is_file() and entry.name not in known
+                        and time.time() - entry.stat().st_mtime > options['older_than']):
+                    self.remove(entry.path)
+                    orphans += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} stale uploads and {orphans} orphaned files"
+        ))
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
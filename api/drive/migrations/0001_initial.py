@@ -0,0 +1,34 @@
+# Generated by Django 4.2.19 on 2026-10-18 08:15
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('user_email', models.EmailField(db_index=True, max_length=254)),
+                ('name', models.CharField(max_length=255)),
+                ('mime_type', models.CharField(max_length=255)),
+                ('metadata', models.JSONField(default=dict)),
+                ('path', models.CharField(max_length=1024)),
+                ('total_size', models.BigIntegerField()),
+                ('bytes_uploaded', models.BigIntegerField(default=0)),
+                ('resumable_uri', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('uploading', 'Uploading'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('file_id', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.19 on 2026-10-18 08:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drive', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.EmailField(max_length=254, unique=True)),
+                ('start_page_token', models.CharField(blank=True, max_length=255)),
+                ('last_synced', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DriveFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.EmailField(max_length=254)),
+                ('file_id', models.CharField(max_length=255)),
+                ('name', models.CharField(max_length=1024)),
+                ('mime_type', models.CharField(max_length=255)),
+                ('created_time', models.DateTimeField(null=True)),
+                ('modified_time', models.DateTimeField(null=True)),
+                ('is_owner', models.BooleanField(default=False)),
+                ('can_edit', models.BooleanField(default=False)),
+                ('data', models.JSONField(default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_email', 'modified_time'], name='drive_file_user_modified_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='drivefile',
+            constraint=models.UniqueConstraint(fields=('user_email', 'file_id'), name='drive_file_user_file_uniq'),
+        ),
+    ]
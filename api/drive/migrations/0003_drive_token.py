@@ -0,0 +1,26 @@
+# Generated by Django 4.2.19 on 2026-10-18 08:22
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drive', '0002_drive_mirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriveToken',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('user_email', models.EmailField(blank=True, db_index=True, max_length=254)),
+                ('email_expires', models.DateTimeField(null=True)),
+                ('credentials', models.TextField()),
+                ('expiry', models.DateTimeField(null=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_modification', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
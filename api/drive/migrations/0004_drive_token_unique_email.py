@@ -0,0 +1,36 @@
+# Generated by Django 4.2.19 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+def dedupe_tokens(apps, schema_editor):
+    """Keep the most recently modified row of each user, unknown emails become NULL"""
+    DriveToken = apps.get_model('drive', 'DriveToken')
+    DriveToken.objects.filter(user_email='').update(user_email=None)
+    seen = set()
+    for token in DriveToken.objects.exclude(user_email=None).order_by('-date_modification'):
+        if token.user_email in seen:
+            token.delete()
+        else:
+            seen.add(token.user_email)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drive', '0003_drive_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='drivetoken',
+            name='user_email',
+            field=models.EmailField(blank=True, db_index=True, max_length=254, null=True),
+        ),
+        migrations.RunPython(dedupe_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='drivetoken',
+            name='user_email',
+            field=models.EmailField(blank=True, max_length=254, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drive', '0004_drive_token_unique_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='drivesyncstate',
+            name='sync_started',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -1,3 +1,75 @@
 from django.db import models
+import uuid
 
-# Create your models here.
+class DriveUpload(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_UPLOADING = 'uploading'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_UPLOADING, 'Uploading'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_email = models.EmailField(db_index=True)
+    name = models.CharField(max_length=255)
+    mime_type = models.CharField(max_length=255)
+    metadata = models.JSONField(default=dict)
+    path = models.CharField(max_length=1024)
+    total_size = models.BigIntegerField()
+    bytes_uploaded = models.BigIntegerField(default=0)
+    resumable_uri = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    file_id = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+class DriveFile(models.Model):
+    user_email = models.EmailField()
+    file_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=1024)
+    mime_type = models.CharField(max_length=255)
+    created_time = models.DateTimeField(null=True)
+    modified_time = models.DateTimeField(null=True)
+    is_owner = models.BooleanField(default=False)
+    can_edit = models.BooleanField(default=False)
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_email', 'file_id'], name='drive_file_user_file_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user_email', 'modified_time'], name='drive_file_user_modified_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class DriveSyncState(models.Model):
+    user_email = models.EmailField(unique=True)
+    start_page_token = models.CharField(max_length=255, blank=True)
+    last_synced = models.DateTimeField(null=True)
+    sync_started = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"{self.user_email} @ {self.start_page_token}"
+
+class DriveToken(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_email = models.EmailField(null=True, blank=True, unique=True)
+    email_expires = models.DateTimeField(null=True)
+    credentials = models.TextField()
+    expiry = models.DateTimeField(null=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_modification = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.user_email or str(self.id)
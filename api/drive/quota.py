@@ -0,0 +1,231 @@
+"""Retries and rate limiting for Google Drive calls
+
+Service clients are built with DriveHttpRequest, so every execute() and
+upload chunk goes through DriveQuota.call. A call first takes a token from a
+bucket per user and from one for the whole project, both kept in the Django
+cache so every worker draws from the same quota (provided CACHES is shared,
+see api/cache.py), and waits when the buckets run dry. Calls failing with
+429, 5xx or a rate limit 403 are then retried with exponential backoff and
+full jitter, honouring Retry-After.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from asgiref.sync import sync_to_async
+from googleapiclient.errors import HttpError
+from google.auth.credentials import Credentials
+from api.instrumentation import InstrumentedHttpRequest, registry, span
+from functools import partial
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class DriveRateLimited(Exception):
+    """A call would have waited more than GOOGLE_DRIVE_THROTTLE_MAX_WAIT for a token"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Bucket refilled to capacity every capacity / rate seconds, counted in the Django cache
+
+    Each refill period has its own counter, taken from with an atomic
+    cache.incr, so no lock is held across workers. A caller finding the
+    current period spent takes from the next one instead and is told how
+    long to wait for it to start.
+    """
+
+    def __init__(self, key, rate, capacity):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.period = capacity / rate
+
+    def take(self, tokens=1, max_wait=None):
+        """Take tokens, returning the seconds to wait before spending them
+
+        Nothing is taken and None is returned if the wait would exceed max_wait.
+        """
+        tokens = min(tokens, self.capacity)
+        now = time.time()
+        window = int(now // self.period)
+        while True:
+            wait = max(0.0, window * self.period - now)
+            if max_wait is not None and wait > max_wait:
+                return None
+            key = f'{self.key}:{window}'
+            cache.add(key, 0, timeout=int(wait + self.period) + 1)
+            if cache.incr(key, tokens) <= self.capacity:
+                return wait
+            window += 1
+
+
+class DriveQuota:
+    """Helper class pacing and retrying Drive calls"""
+
+    @staticmethod
+    def user_credentials(http):
+        """Credentials an authorized http sends, None for a plain httplib2.Http"""
+        # httplib2.Http has a credentials attribute too, its own password store
+        credentials = getattr(http, 'credentials', None)
+        return credentials if isinstance(credentials, Credentials) else None
+
+    @staticmethod
+    def buckets(credentials):
+        buckets = []
+        identity = credentials and (credentials.refresh_token or credentials.token)
+        if identity and settings.GOOGLE_DRIVE_USER_RATE:
+            digest = hashlib.sha256(identity.encode()).hexdigest()
+            buckets.append(('user', TokenBucket(
+                f'drive:bucket:user:{digest}',
+                settings.GOOGLE_DRIVE_USER_RATE,
+                settings.GOOGLE_DRIVE_USER_BURST
+            )))
+        if settings.GOOGLE_DRIVE_PROJECT_RATE:
+            buckets.append(('project', TokenBucket(
+                'drive:bucket:project',
+                settings.GOOGLE_DRIVE_PROJECT_RATE,
+                settings.GOOGLE_DRIVE_PROJECT_BURST
+            )))
+        return buckets
+
+    @staticmethod
+    def reserve(credentials, tokens=1):
+        """Take tokens from the user and project buckets, returning the seconds to wait"""
+        wait = 0.0
+        for scope, bucket in DriveQuota.buckets(credentials):
+            scope_wait = bucket.take(tokens, settings.GOOGLE_DRIVE_THROTTLE_MAX_WAIT)
+            if scope_wait is None:
+                registry.increment('google_api_rate_limited_total', {'scope': scope})
+                # Calls queued ahead of this one drain within the max wait
+                raise DriveRateLimited(
+                    f"Drive {scope} rate limit reached, try again later",
+                    retry_after=max(1, math.ceil(settings.GOOGLE_DRIVE_THROTTLE_MAX_WAIT or 0))
+                )
+            if scope_wait > 0:
+                registry.increment('google_api_throttled_total', {'scope': scope})
+                registry.observe('google_api_throttle_wait_seconds', {'scope': scope}, scope_wait)
+            wait = max(wait, scope_wait)
+        return wait
+
+    @staticmethod
+    def error_reason(content):
+        try:
+            return json.loads(content)['error']['errors'][0]['reason']
+        except (ValueError, TypeError, KeyError, IndexError):
+            return None
+
+    @staticmethod
+    def retry_reason(error, idempotent=True):
+        """Why error is worth retrying, e.g. '503' or 'rateLimitExceeded', None if it is not"""
+        if isinstance(error, HttpError):
+            if error.resp.status in RETRY_STATUSES:
+                return str(error.resp.status)
+            if error.resp.status == 403:
+                reason = DriveQuota.error_reason(error.content)
+                if reason in RATE_LIMIT_REASONS:
+                    return reason
+            return None
+        # The request may or may not have reached Drive
+        if idempotent and isinstance(error, (ConnectionError, TimeoutError)):
+            return type(error).__name__
+        return None
+
+    @staticmethod
+    def backoff(attempt, error):
+        delay = random.uniform(0, min(
+            settings.GOOGLE_DRIVE_BACKOFF_MAX,
+            settings.GOOGLE_DRIVE_BACKOFF_BASE * 2 ** attempt
+        ))
+        resp = getattr(error, 'resp', None)
+        try:
+            retry_after = float(resp.get('retry-after')) if resp is not None else 0
+        except (TypeError, ValueError):
+            retry_after = 0
+        return max(delay, min(retry_after, settings.GOOGLE_DRIVE_BACKOFF_MAX))
+
+    @staticmethod
+    def retry_delay(error, attempt, method, idempotent=True):
+        """Seconds to wait before retrying after error, None to give up"""
+        reason = DriveQuota.retry_reason(error, idempotent)
+        if reason is None:
+            return None
+        if attempt >= settings.GOOGLE_DRIVE_MAX_RETRIES:
+            registry.increment('google_api_retries_exhausted_total', {'method': method})
+            return None
+        registry.increment('google_api_retries_total', {'method': method, 'reason': reason})
+        delay = DriveQuota.backoff(attempt, error)
+        logger.warning(f"Retrying {method} in {delay:.2f}s after {reason} (attempt {attempt + 1})")
+        return delay
+
+    @staticmethod
+    def call(send, credentials, method, tokens=1, idempotent=True):
+        """Run send() within the rate limits, retrying transient failures"""
+        attempt = 0
+        while True:
+            wait = DriveQuota.reserve(credentials, tokens)
+            if wait:
+                with span('throttle'):
+                    time.sleep(wait)
+            try:
+                return send()
+            except Exception as e:
+                delay = DriveQuota.retry_delay(e, attempt, method, idempotent)
+                if delay is None:
+                    raise
+            with span('retry_backoff'):
+                time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    async def call_async(send, credentials, method, tokens=1, idempotent=True):
+        """call() for coroutine functions, waiting without blocking the event loop"""
+        attempt = 0
+        while True:
+            wait = await sync_to_async(DriveQuota.reserve, thread_sensitive=False)(credentials, tokens)
+            if wait:
+                with span('throttle'):
+                    await asyncio.sleep(wait)
+            try:
+                return await send()
+            except Exception as e:
+                delay = DriveQuota.retry_delay(e, attempt, method, idempotent)
+                if delay is None:
+                    raise
+            with span('retry_backoff'):
+                await asyncio.sleep(delay)
+            attempt += 1
+
+
+class DriveHttpRequest(InstrumentedHttpRequest):
+    """Request executed through DriveQuota, passed to build as requestBuilder"""
+
+    def credentials(self, http):
+        return DriveQuota.user_credentials(http or self.http)
+
+    def execute(self, http=None, num_retries=0):
+        return DriveQuota.call(
+            partial(super().execute, http=http, num_retries=num_retries),
+            self.credentials(http),
+            self.methodId,
+            idempotent=self.method in ('GET', 'HEAD')
+        )
+
+    def next_chunk(self, http=None, num_retries=0):
+        # A chunk sent again after an error starts with a progress query
+        return DriveQuota.call(
+            partial(super().next_chunk, http=http, num_retries=num_retries),
+            self.credentials(http),
+            f'{self.methodId}.upload'
+        )
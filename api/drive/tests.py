@@ -1,3 +1,599 @@
-from django.test import TestCase
+from django.conf import settings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from datetime import datetime, timedelta
+from .fake_drive import FakeDrive, FakeDriveServer
+from .download_cache import download_cache
+from .quota import DriveQuota, DriveRateLimited, TokenBucket
+from .models import DriveFile, DriveSyncState, DriveToken, DriveUpload
+from . import async_views
+from .views import (DriveBatch, DriveMirror, DrivePermissions, ServiceClientCache, TokenRefresher, credential_store,
+                    load_credentials, service_cache)
+import httplib2
+import io
+import json
+import os
+import tempfile
+import threading
+import time
 
 # Create your tests here.
+class FakeDriveTestCase(TestCase):
+    """Drive views talking to a local FakeDrive instead of Google"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.drive = FakeDrive(user_email='me@example.com')
+        self.server = FakeDriveServer(self.drive).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        for api, version in (('drive', 'v3'), ('oauth2', 'v2')):
+            service_cache.set_document(
+                api, version, self.server.document(service_cache.get_document(api, version))
+            )
+        self.addCleanup(service_cache.clear)
+        self.addCleanup(credential_store.clear)
+
+        token = credential_store.create(Credentials(
+            token='fake-token',
+            refresh_token='fake-refresh',
+            token_uri=f'{self.server.url}token',
+            client_id='client',
+            client_secret='secret',
+            expiry=datetime.utcnow() + timedelta(hours=1)
+        ), None, None)
+        response = HttpResponse()
+        credential_store.set_cookie(response, token.id)
+        self.token_id = token.id
+        self.client.cookies[credential_store.cookie_name] = response.cookies[credential_store.cookie_name].value
+
+class DriveViewsTests(FakeDriveTestCase):
+
+    def test_list_resolves_email_once(self):
+        self.drive.add_file('mine', owner='me@example.com')
+        self.drive.add_file('theirs', owner='other@example.com')
+        for _ in range(2):
+            response = self.client.get('/drive/list/')
+            self.assertEqual(response.status_code, 200)
+        files = {file['id']: file for file in response.json()['files']}
+        self.assertTrue(files['mine']['is_owner'])
+        self.assertFalse(files['theirs']['is_owner'])
+        self.assertEqual(self.drive.calls['GET /oauth2/v2/userinfo'], 1)
+
+    def test_rate_limited_calls_get_429(self):
+        self.drive.add_file('mine', owner='me@example.com')
+        self.assertEqual(self.client.get('/drive/list/').status_code, 200)
+        with override_settings(GOOGLE_DRIVE_USER_RATE=0.01, GOOGLE_DRIVE_USER_BURST=1,
+                               GOOGLE_DRIVE_THROTTLE_MAX_WAIT=0):
+            self.assertEqual(self.client.get('/drive/list/').status_code, 200)
+            for path in ('/drive/list/', '/drive/async/list/'):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 429)
+                self.assertEqual(response['Retry-After'], '1')
+
+    def test_one_token_row_per_user(self):
+        self.client.get('/drive/list/')
+        stored = credential_store.load(self.token_id)
+        token = credential_store.create(stored.credentials, 'me@example.com', None)
+        self.assertEqual(token.id, self.token_id)
+
+        token = credential_store.create(stored.credentials, None, None)
+        credential_store.save_email(token.id, 'me@example.com', None)
+        self.assertEqual(list(DriveToken.objects.values_list('id', flat=True)), [token.id])
+
+    def test_fresh_token_ignores_shared_refresh(self):
+        stored = credential_store.load(self.token_id)
+        shared = load_credentials(stored.credentials.to_json())
+        shared.token = 'shared-token'
+        shared.expiry = datetime.utcnow() + timedelta(hours=2)
+        cache.set(TokenRefresher.key(shared, 'credentials'), shared.to_json())
+
+        response = self.client.get('/drive/list/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(credential_store.load(self.token_id).credentials.token, 'fake-token')
+
+    @override_settings(GOOGLE_DRIVE_BACKOFF_BASE=0)
+    def test_upstream_error_is_reported(self):
+        self.drive.add_file('mine', owner='me@example.com')
+        self.drive.fail('GET', r'/drive/v3/files/mine', status=503,
+                        times=settings.GOOGLE_DRIVE_MAX_RETRIES + 1)
+        with self.assertLogs('drive.views', 'ERROR'), self.assertLogs('drive.quota', 'WARNING'):
+            response = self.client.get('/drive/file/mine/')
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('backendError', response.json()['error'])
+        self.assertEqual(self.client.get('/drive/file/mine/').status_code, 200)
+
+    @override_settings(GOOGLE_DRIVE_BACKOFF_BASE=0)
+    def test_transient_errors_are_retried(self):
+        self.drive.add_file('mine', owner='me@example.com')
+        self.drive.fail('GET', r'/drive/v3/files/mine', status=503)
+        self.drive.fail('GET', r'/drive/v3/files/mine', status=403)
+        with self.assertLogs('drive.quota', 'WARNING') as logs:
+            response = self.client.get('/drive/file/mine/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('userRateLimitExceeded', logs.output[1])
+
+    def test_permanent_errors_are_not_retried(self):
+        self.drive.fail('GET', r'/drive/v3/files/missing', status=404)
+        with self.assertLogs('drive.views', 'ERROR'):
+            response = self.client.get('/drive/file/missing/')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/missing'], 1)
+
+    def test_metadata_is_cached_until_written(self):
+        self.drive.add_file('mine', name='Old', owner='me@example.com')
+        for _ in range(2):
+            self.assertEqual(self.client.get('/drive/file/mine/').json()['name'], 'Old')
+            self.assertEqual(self.client.get('/drive/update/mine/').status_code, 200)
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/mine'], 1)
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/mine/permissions'], 1)
+
+        response = self.client.put('/drive/update/mine/', {'name': 'New'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.client.get('/drive/file/mine/').json()['name'], 'New')
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/mine'], 1)
+        self.client.get('/drive/update/mine/')
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/mine/permissions'], 2)
+
+        self.assertEqual(self.client.delete('/drive/delete/mine/').status_code, 200)
+        with self.assertLogs('drive.views', 'ERROR'):
+            self.assertEqual(self.client.get('/drive/file/mine/').status_code, 500)
+
+    def test_async_views_share_one_client_under_wsgi(self):
+        self.drive.add_file('mine', owner='me@example.com')
+        clients = []
+        for _ in range(2):
+            self.assertEqual(self.client.get('/drive/async/file/mine/').status_code, 200)
+            clients.append(async_views._clients[async_views.background_loop.get()])
+        self.assertIs(clients[0], clients[1])
+        self.assertFalse(clients[0].is_closed)
+
+    def test_async_writes_refresh_the_caches(self):
+        self.drive.add_file('mine', name='Old', owner='me@example.com')
+        etag = self.client.get('/drive/file/mine/')['ETag']
+
+        response = self.client.put('/drive/async/update/mine/', {'name': 'New'},
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.get('/drive/file/mine/')
+        self.assertEqual(response.json()['name'], 'New')
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.put('/drive/update/mine/', {'name': 'Newer'},
+                                   content_type='application/json', HTTP_IF_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200, response.content)
+
+        self.assertEqual(self.client.delete('/drive/async/delete/mine/').status_code, 200)
+        with self.assertLogs('drive.views', 'ERROR'):
+            self.assertEqual(self.client.get('/drive/file/mine/').status_code, 500)
+
+    def test_async_writes_check_if_match(self):
+        self.drive.add_file('mine', owner='me@example.com', version='3')
+        self.drive.add_file('theirs', owner='other@example.com')
+        response = self.client.put('/drive/async/update/mine/', {'name': 'New'},
+                                   content_type='application/json', HTTP_IF_MATCH='"2"')
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete('/drive/async/delete/mine/', HTTP_IF_MATCH='"2"')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(self.client.delete('/drive/async/delete/theirs/').status_code, 403)
+
+        response = self.client.put('/drive/async/update/mine/', {'name': 'New'},
+                                   content_type='application/json', HTTP_IF_MATCH='"3"')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.drive.files['mine']['name'], 'New')
+        # The state is read once, then kept current by the writes
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/mine'], 1)
+
+    def test_stale_mirror_does_not_approve_writes(self):
+        mirrored = {'id': 'moved', 'owners': [{'emailAddress': 'me@example.com'}], 'version': '1'}
+        DriveMirror.save('me@example.com', [mirrored])
+        DriveSyncState.objects.create(
+            user_email='me@example.com',
+            last_synced=timezone.now() - timedelta(days=2)
+        )
+        self.drive.add_file('moved', owner='other@example.com', version='2')
+        response = self.client.delete('/drive/delete/moved/', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('moved', self.drive.files)
+
+        DriveSyncState.objects.update(last_synced=timezone.now())
+        cache.clear()
+        response = self.client.delete('/drive/delete/moved/', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_mirror_refresh_is_claimed_once(self):
+        self.drive.add_file('a', owner='me@example.com')
+        self.drive.add_file('b', owner='me@example.com')
+        mirrored = lambda: set(DriveFile.objects.values_list('file_id', flat=True))
+        self.assertEqual(self.client.get('/drive/list/?max_age=60').status_code, 200)
+        self.assertEqual(mirrored(), {'a', 'b'})
+        self.assertIsNone(DriveSyncState.objects.get().sync_started)
+
+        self.drive.remove_file('b')
+        self.drive.add_file('c', owner='me@example.com')
+        DriveSyncState.objects.update(last_synced=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.client.get('/drive/list/?max_age=60').status_code, 200)
+        self.assertEqual(mirrored(), {'a', 'c'})
+
+        # While another request refreshes, a stale mirror is bypassed, not waited on
+        DriveSyncState.objects.update(
+            last_synced=timezone.now() - timedelta(hours=1),
+            sync_started=timezone.now()
+        )
+        calls = self.drive.calls['GET /drive/v3/changes']
+        response = self.client.get('/drive/list/?max_age=60')
+        self.assertEqual({file['id'] for file in response.json()['files']}, {'a', 'c'})
+        self.assertEqual(self.drive.calls['GET /drive/v3/changes'], calls)
+
+        # A failed walk releases the claim and leaves the rows alone
+        DriveSyncState.objects.update(sync_started=None)
+        self.drive.fail('GET', r'/drive/v3/changes', 404)
+        self.assertEqual(self.client.get('/drive/list/?max_age=60').status_code, 500)
+        self.assertIsNone(DriveSyncState.objects.get().sync_started)
+        self.assertEqual(mirrored(), {'a', 'c'})
+
+    @override_settings(GOOGLE_DRIVE_UPLOAD_DIR=tempfile.mkdtemp(), GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE=256 * 1024)
+    def test_upload_then_ranged_download(self):
+        content = bytes(range(256)) * 2048
+        with tempfile.NamedTemporaryFile(suffix='.bin') as fh:
+            fh.write(content)
+            fh.seek(0)
+            response = self.client.post('/drive/create/', {'name': 'data.bin', 'file': fh})
+        self.assertEqual(response.status_code, 200, response.content)
+        file_id = response.json()['file_id']
+        self.assertEqual(self.drive.files[file_id]['content'], content)
+
+        response = self.client.get(f'/drive/download/{file_id}/', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[10:20])
+
+class TokenRefresherTests(FakeDriveTestCase):
+
+    def expiring(self, seconds):
+        credentials = load_credentials(credential_store.load(self.token_id).credentials.to_json())
+        credentials.expiry = datetime.utcnow() + timedelta(seconds=seconds)
+        return credentials
+
+    def test_copies_keep_the_token_uri(self):
+        self.assertEqual(self.expiring(0).token_uri, f'{self.server.url}token')
+
+    def test_concurrent_refreshes_call_the_token_endpoint_once(self):
+        self.drive.latency = 0.05
+        tokens = []
+        threads = [
+            threading.Thread(target=lambda: tokens.append(TokenRefresher.refresh(self.expiring(-60)).token))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.drive.calls['POST /token'], 1)
+        self.assertEqual(len(tokens), 8)
+        self.assertEqual(len(set(tokens)), 1)
+        self.assertNotEqual(tokens[0], 'fake-token')
+
+    def test_token_due_soon_is_refreshed_in_the_background(self):
+        self.drive.latency = 0.05
+        credentials = self.expiring(60)
+        credential_store.save_credentials(self.token_id, credentials)
+        pending = TokenRefresher.refresh_in_background(credentials)
+        self.assertIsNone(TokenRefresher.refresh_in_background(credentials))
+        # Requests go on with the current token meanwhile
+        response = self.client.get('/drive/list/')
+        self.assertEqual(response.status_code, 200)
+        pending.result(timeout=5)
+
+        self.assertEqual(self.client.get('/drive/list/').status_code, 200)
+        self.assertEqual(self.drive.calls['POST /token'], 1)
+        self.assertNotEqual(credential_store.load(self.token_id).credentials.token, 'fake-token')
+
+class DriveUploadTests(FakeDriveTestCase):
+
+    @override_settings(GOOGLE_DRIVE_UPLOAD_DIR=tempfile.mkdtemp())
+    def test_upload_needs_the_account_email(self):
+        self.drive.fail('GET', r'/oauth2/v2/userinfo', status=404)
+        with self.assertLogs('drive.views', 'ERROR'):
+            response = self.client.post('/drive/create/', {
+                'name': 'data.bin', 'file': io.BytesIO(b'content')
+            })
+        self.assertEqual(response.status_code, 403, response.content)
+        self.assertFalse(DriveUpload.objects.exists())
+        self.assertEqual(os.listdir(settings.GOOGLE_DRIVE_UPLOAD_DIR), [])
+
+class DriveBatchTests(FakeDriveTestCase):
+
+    def service(self, http):
+        return build_from_document(
+            self.server.document(service_cache.get_document('drive', 'v3')), http=http
+        )
+
+    def grant(self, service, email):
+        return service.permissions().create(
+            fileId='shared', body={'type': 'user', 'role': 'writer', 'emailAddress': email}
+        )
+
+    @override_settings(GOOGLE_DRIVE_USER_RATE=1, GOOGLE_DRIVE_PROJECT_RATE=100)
+    def test_batch_over_unauthorized_http(self):
+        self.drive.add_file('shared')
+        service = self.service(httplib2.Http())
+        results = DriveBatch.execute(service, [self.grant(service, 'a@example.com')])
+        self.assertEqual([exception for response, exception in results], [None])
+
+    @override_settings(GOOGLE_DRIVE_BATCH_SIZE=2, GOOGLE_DRIVE_BACKOFF_BASE=0.01)
+    def test_grants_are_sent_in_batches(self):
+        self.drive.add_file('shared')
+        service = self.service(httplib2.Http())
+        emails = [f'user{i}@example.com' for i in range(5)]
+        self.drive.fail('POST', r'/drive/v3/files/shared/permissions', 503)
+        requests = self.drive.requests
+        results = DriveBatch.execute(service, [self.grant(service, email) for email in emails])
+
+        # Three batches of at most two grants, then the failed grant again on its own
+        self.assertEqual(self.drive.requests - requests, 4)
+        self.assertEqual(self.drive.calls['POST /drive/v3/files/shared/permissions'], 6)
+        self.assertEqual([exception for response, exception in results], [None] * 5)
+        self.assertEqual(sorted(permission['emailAddress']
+                                for permission in self.drive.files['shared']['permissions'].values()),
+                         emails)
+
+    def test_failed_grants_are_reported_per_item(self):
+        self.drive.add_file('shared')
+        service = self.service(httplib2.Http())
+        grants = [{'action': 'grant', 'email': email, 'role': 'writer'}
+                  for email in ('a@example.com', 'b@example.com')]
+        self.drive.fail('POST', r'/drive/v3/files/shared/permissions', 404)
+        results = DriveBatch.execute(service, [self.grant(service, grant['email']) for grant in grants])
+        report = DriveBatch.report(grants, results)
+        self.assertEqual([item['success'] for item in report], [False, True])
+        self.assertIn('notFound', report[0]['error'])
+        self.assertEqual(DriveBatch.execute(service, []), [])
+
+class DriveListTests(FakeDriveTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            self.drive.add_file(f'file{i}', owner='me@example.com')
+
+    def test_fields_mask(self):
+        self.assertEqual(self.client.get('/drive/list/', {'fields': 'id; drop'}).status_code, 400)
+        self.assertEqual(self.client.get('/drive/list/', {'page_size': 0}).status_code, 400)
+
+        for params in ({}, {'max_age': 60}):
+            response = self.client.get('/drive/list/', {'fields': 'id, name', **params})
+            self.assertEqual(response.status_code, 200, response.content)
+            file = response.json()['files'][0]
+            # Owners are fetched for is_owner but not returned unless asked for
+            self.assertNotIn('owners', file)
+            self.assertTrue(file['is_owner'])
+
+        response = self.client.get('/drive/list/', {'fields': 'id, owners(emailAddress)', 'max_age': 60})
+        self.assertEqual(set(response.json()['files'][0]) - {'user_email', 'is_owner'}, {'id', 'owners'})
+
+    def test_stream_walks_every_page(self):
+        for params in ({}, {'max_age': 60}):
+            response = self.client.get('/drive/list/', {'stream': 1, 'page_size': 2, **params})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            files = json.loads(b''.join(response.streaming_content))
+            self.assertEqual(sorted(file['id'] for file in files), [f'file{i}' for i in range(5)])
+        # Three live pages, then the mirror seed in one
+        self.assertEqual(self.drive.calls['GET /drive/v3/files'], 4)
+
+class DrivePermissionsTests(FakeDriveTestCase):
+
+    def test_diff_keeps_only_real_changes(self):
+        index = {
+            'owner@example.com': {'id': 'o', 'role': 'owner'},
+            'reader@example.com': {'id': 'r', 'role': 'reader'},
+            'writer@example.com': {'id': 'w', 'role': 'writer'},
+        }
+        changes = DrivePermissions.diff(index, [
+            {'email': 'Reader@example.com', 'role': 'reader'},
+            {'email': 'writer@example.com', 'role': 'reader'},
+            {'email': 'owner@example.com', 'role': 'reader'},
+            {'email': 'new@example.com'},
+        ], ['READER@example.com', 'owner@example.com', 'unknown@example.com'])
+        self.assertEqual(changes, [
+            {'action': 'update', 'email': 'writer@example.com', 'role': 'reader', 'permission_id': 'w'},
+            {'action': 'grant', 'email': 'new@example.com', 'role': 'reader'},
+            {'action': 'revoke', 'email': 'READER@example.com', 'permission_id': 'r'},
+        ])
+
+    def test_update_reads_one_snapshot(self):
+        self.drive.add_file('mine', owner='me@example.com')
+        for i in range(120):
+            self.drive.create_permission('mine', {}, {'role': 'reader', 'emailAddress': f'user{i}@example.com'}, {})
+
+        response = self.client.put('/drive/update/mine/', {
+            'name': 'Shared',
+            'share_updates': [
+                {'email': 'user0@example.com', 'role': 'reader'},
+                {'email': 'user119@example.com', 'role': 'writer'},
+                {'email': 'new@example.com', 'role': 'writer'},
+            ],
+            'remove_permissions': ['user1@example.com', 'nobody@example.com']
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([(item['action'], item['success']) for item in response.json()['permission_results']],
+                         [('update', True), ('grant', True), ('revoke', True)])
+
+        # Every page of the snapshot is read once, and unchanged grants are left alone
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/mine/permissions'], 2)
+        self.assertEqual(self.drive.calls['POST /drive/v3/files/mine/permissions'], 1)
+        roles = {permission['emailAddress']: permission['role']
+                 for permission in self.drive.files['mine']['permissions'].values()}
+        self.assertEqual((roles['user119@example.com'], roles['new@example.com']), ('writer', 'writer'))
+        self.assertNotIn('user1@example.com', roles)
+
+class ServiceClientCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = ServiceClientCache(maxsize=4, ttl=60)
+
+    def test_discovery_document_is_parsed_once(self):
+        document = self.cache.get_document('drive', 'v3')
+        self.assertIs(self.cache.get_document('drive', 'v3'), document)
+        self.assertIsNot(self.cache.get_document('oauth2', 'v2'), document)
+        with self.assertRaises(ValueError):
+            self.cache.get_document('drive', 'v0')
+
+    def test_clients_are_per_token_and_thread(self):
+        first = Credentials(token='first')
+        client = self.cache.get('drive', 'v3', first)
+        self.assertIs(self.cache.get('drive', 'v3', Credentials(token='first')), client)
+        self.assertIsNot(self.cache.get('drive', 'v3', Credentials(token='second')), client)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.cache.get('drive', 'v3', first)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], client)
+
+        # A replaced document drops the clients built from the previous one
+        self.cache.set_document('drive', 'v3', self.cache.get_document('drive', 'v3'))
+        self.assertIsNot(self.cache.get('drive', 'v3', first), client)
+
+class TokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_burst_then_paced(self):
+        bucket = TokenBucket('test:bucket', rate=10, capacity=2)
+        # Two calls per 0.2s period, starting with the current one
+        waits = [bucket.take() for _ in range(6)]
+        self.assertEqual(waits[:2], [0, 0])
+        self.assertTrue(0 < waits[2] <= 0.2)
+        self.assertAlmostEqual(waits[3], waits[2], delta=0.01)
+        self.assertAlmostEqual(waits[4], waits[2] + 0.2, delta=0.01)
+        self.assertAlmostEqual(waits[5], waits[2] + 0.2, delta=0.01)
+        self.assertIsNone(bucket.take(max_wait=0.2))
+
+    def test_concurrent_takes_never_overdraw(self):
+        bucket = TokenBucket('test:bucket', rate=1, capacity=5)
+        waits = []
+        threads = [
+            threading.Thread(target=lambda: waits.append(bucket.take(max_wait=0)))
+            for _ in range(20)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        granted = [wait for wait in waits if wait is not None]
+        self.assertEqual(len(granted), 5)
+
+    @override_settings(GOOGLE_DRIVE_USER_RATE=1, GOOGLE_DRIVE_USER_BURST=1, GOOGLE_DRIVE_THROTTLE_MAX_WAIT=0)
+    def test_buckets_are_per_user(self):
+        alice = Credentials(token='a', refresh_token='alice')
+        bob = Credentials(token='b', refresh_token='bob')
+        self.assertEqual(DriveQuota.reserve(alice), 0)
+        self.assertEqual(DriveQuota.reserve(bob), 0)
+        with self.assertRaises(DriveRateLimited):
+            DriveQuota.reserve(alice)
+
+@override_settings(GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR=tempfile.mkdtemp())
+class DownloadCacheTests(FakeDriveTestCase):
+
+    def download(self, file_id):
+        response = self.client.get(f'/drive/download/{file_id}/')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_second_download_is_a_hit(self):
+        content = bytes(range(256)) * 64
+        self.drive.add_file('popular', owner='me@example.com', content=content)
+        self.assertEqual(self.download('popular'), content)
+        self.assertEqual(self.download('popular'), content)
+        self.assertEqual(self.drive.calls['GET /drive/v3/files/popular'], 3)
+
+        # A new version is a different entry
+        self.drive.files['popular'].update(version='2', content=content[::-1])
+        self.assertEqual(self.download('popular'), content[::-1])
+
+    @override_settings(GOOGLE_DRIVE_DOWNLOAD_CACHE_SIZE=10000)
+    def test_least_recently_used_is_evicted(self):
+        for file_id in ('a', 'b', 'c'):
+            self.drive.add_file(file_id, owner='me@example.com', content=file_id.encode() * 4000)
+            self.download(file_id)
+            time.sleep(0.01)
+        cached = [os.path.exists(download_cache.path(download_cache.key(file_id, self.drive.files[file_id])))
+                  for file_id in ('a', 'b', 'c')]
+        self.assertEqual(cached, [False, True, True])
+
+class FakeUpstream:
+    """Response whose chunks are released one at a time"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.release = threading.Semaphore(0)
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.release.acquire()
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+@override_settings(GOOGLE_DRIVE_DOWNLOAD_CACHE_DIR=tempfile.mkdtemp())
+class DownloadFillTests(SimpleTestCase):
+
+    def test_readers_follow_a_single_fill(self):
+        upstream = FakeUpstream([b'abc', b'def'])
+        key = download_cache.key('shared', {'version': '1', 'size': '6'})
+        first = download_cache.fill(key, upstream, upstream, 6).stream(1024)
+        second_upstream = FakeUpstream([])
+        joined = download_cache.fill(key, second_upstream, second_upstream, 6)
+        self.assertTrue(second_upstream.closed)
+
+        upstream.release.release()
+        self.assertEqual(next(first), b'abc')
+        upstream.release.release()
+        self.assertEqual(b''.join(joined.stream(1024)), b'abcdef')
+        self.assertEqual(b''.join(first), b'def')
+        self.assertTrue(upstream.closed)
+        with download_cache.open(key) as fh:
+            self.assertEqual(fh.read(), b'abcdef')
+
+@override_settings(GOOGLE_DRIVE_UPLOAD_DIR=tempfile.mkdtemp())
+class CleanUploadsTests(TestCase):
+
+    def spool(self, status, age):
+        upload = DriveUpload.objects.create(
+            user_email='me@example.com', name='report.pdf', mime_type='application/pdf',
+            path='', total_size=1, status=status
+        )
+        upload.path = os.path.join(settings.GOOGLE_DRIVE_UPLOAD_DIR, str(upload.id))
+        with open(upload.path, 'wb') as fh:
+            fh.write(b'x')
+        DriveUpload.objects.filter(id=upload.id).update(
+            path=upload.path, date_modification=timezone.now() - timedelta(seconds=age)
+        )
+        return upload
+
+    def test_removes_stale_uploads_and_files(self):
+        stale = self.spool(DriveUpload.STATUS_FAILED, age=7200)
+        recent = self.spool(DriveUpload.STATUS_FAILED, age=60)
+        done = self.spool(DriveUpload.STATUS_DONE, age=7200)
+        orphan = os.path.join(settings.GOOGLE_DRIVE_UPLOAD_DIR, 'orphan')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (time.time() - 7200, time.time() - 7200))
+
+        call_command('clean_uploads', older_than=3600, stdout=io.StringIO())
+
+        self.assertEqual(
+            set(DriveUpload.objects.values_list('id', flat=True)), {recent.id, done.id}
+        )
+        self.assertFalse(os.path.exists(stale.path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(recent.path))
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     path('auth/', views.DriveAuthView.as_view(), name='google_drive_auth'),
@@ -9,5 +9,10 @@ urlpatterns = [
     path('create/', views.DriveFileCreateView.as_view(), name='create_file'),
     path('update/<str:file_id>/', views.DriveFileUpdateView.as_view(), name='update_file'),
     path('delete/<str:file_id>/', views.DriveFileDeleteView.as_view(), name='delete_file'),
+    path('upload/<uuid:upload_id>/', views.DriveUploadStatusView.as_view(), name='upload_status'),
     path('download/<str:file_id>/', views.DriveDownloadView.as_view(), name='download_file'),
+    path('async/list/', async_views.AsyncDriveListFilesView.as_view(), name='async_list_drive_files'),
+    path('async/file/<str:file_id>/', async_views.AsyncDriveFileDetailView.as_view(), name='async_file_detail'),
+    path('async/update/<str:file_id>/', async_views.AsyncDriveFileUpdateView.as_view(), name='async_update_file'),
+    path('async/delete/<str:file_id>/', async_views.AsyncDriveFileDeleteView.as_view(), name='async_delete_file'),
 ]
\ No newline at end of file
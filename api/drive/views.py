@@ -1,41 +1,357 @@
 from django.shortcuts import redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.conf import settings
 from django.views import View
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from django.core.files.move import file_move_safe
+from django.core.cache import cache
+from django.db import connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.auth import jwt
+from googleapiclient.http import MediaFileUpload
 from googleapiclient.errors import HttpError
-from io import BytesIO
+from api.renderers import JsonResponse, dumps
+from api.instrumentation import registry, span, upstream_call
+from .models import DriveFile, DriveSyncState, DriveToken, DriveUpload
+from .quota import DriveHttpRequest, DriveQuota, DriveRateLimited, RETRY_STATUSES
+from .download_cache import download_cache
+from cachetools import TTLCache
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime, timedelta, timezone as dt_timezone
 import os
 import json
+import hashlib
+import httplib2
 import logging
+import re
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
+def rate_limited(error, **payload):
+    """429 for a call turned down by the local Drive rate limits"""
+    response = JsonResponse({'error': str(error), **payload}, status=429)
+    response['Retry-After'] = str(error.retry_after)
+    return response
+
+class ServiceClientCache:
+    """Process-wide cache of Google API service clients
+
+    Discovery documents are parsed once per API/version and shared by the
+    whole process. Clients bound to a given access token are kept in a
+    bounded LRU with a TTL. httplib2 connections are not thread-safe, so
+    bound clients are never shared between threads.
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self._documents = {}
+        self._clients = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get_document(self, api, version):
+        document = self._documents.get((api, version))
+        if document is not None:
+            return document
+
+        with self._lock:
+            document = self._documents.get((api, version))
+            if document is None:
+                content = get_static_doc(api, version)
+                if content is None:
+                    raise ValueError(f"No discovery document for {api} {version}")
+                document = json.loads(content)
+                # build_from_document fixes up method parameters in place,
+                # do it once here so later builds only rewrite equal values
+                build_from_document(document, developerKey='warmup')
+                self._documents[(api, version)] = document
+        return document
+
+    def set_document(self, api, version, document):
+        """Build api/version clients from the given document, e.g. one for a local fake"""
+        build_from_document(document, developerKey='warmup')
+        with self._lock:
+            self._documents[(api, version)] = document
+            self._clients.clear()
+
+    def get(self, api, version, credentials):
+        key = (api, version, credentials.token, threading.get_ident())
+        with self._lock:
+            client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        client = build_from_document(
+            self.get_document(api, version),
+            credentials=credentials,
+            requestBuilder=DriveHttpRequest
+        )
+        with self._lock:
+            self._clients[key] = client
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self._clients.clear()
+
+service_cache = ServiceClientCache(
+    maxsize=settings.GOOGLE_SERVICE_CACHE_SIZE,
+    ttl=settings.GOOGLE_SERVICE_CACHE_TTL
+)
+
+def load_credentials(data):
+    """Credentials from their to_json(), keeping the token_uri from_authorized_user_info resets"""
+    info = json.loads(data)
+    credentials = Credentials.from_authorized_user_info(info)
+    if info.get('token_uri'):
+        # The copy made by with_token_uri drops the expiry
+        expiry = credentials.expiry
+        credentials = credentials.with_token_uri(info['token_uri'])
+        credentials.expiry = expiry
+    return credentials
+
+class TokenRefresher:
+    """Single-flight OAuth token refresh shared through the Django cache"""
+
+    # Background refreshes in flight in this process, by refresh lock key
+    _pending = set()
+    _pending_lock = threading.Lock()
+    _executor = ThreadPoolExecutor(
+        max_workers=settings.GOOGLE_TOKEN_REFRESH_WORKERS,
+        thread_name_prefix='token-refresh'
+    )
+
+    @staticmethod
+    def key(credentials, name):
+        digest = hashlib.sha256(credentials.refresh_token.encode()).hexdigest()
+        return f'drive:{name}:{digest}'
+
+    @staticmethod
+    def load_shared(credentials):
+        """Newer credentials already refreshed by another request, if any"""
+        info = cache.get(TokenRefresher.key(credentials, 'credentials'))
+        if info is None:
+            return None
+        shared = load_credentials(info)
+        if shared.valid and (credentials.expiry is None or shared.expiry > credentials.expiry):
+            return shared
+        return None
+
+    @staticmethod
+    def refresh_as_leader(credentials):
+        """Refresh if no other request is doing it, returning None otherwise"""
+        lock_key = TokenRefresher.key(credentials, 'refresh-lock')
+        if not cache.add(lock_key, 1, timeout=settings.GOOGLE_TOKEN_REFRESH_LOCK_TIMEOUT):
+            return None
+        try:
+            shared = TokenRefresher.load_shared(credentials)
+            if shared is not None:
+                return shared
+            credentials.refresh(Request())
+            cache.set(
+                TokenRefresher.key(credentials, 'credentials'),
+                credentials.to_json(),
+                timeout=max(int((credentials.expiry - datetime.utcnow()).total_seconds()), 1)
+            )
+            return credentials
+        finally:
+            cache.delete(lock_key)
+
+    @staticmethod
+    def refresh(credentials):
+        """Refresh once per user, concurrent callers wait for the result"""
+        deadline = time.monotonic() + settings.GOOGLE_TOKEN_REFRESH_WAIT
+        while True:
+            refreshed = TokenRefresher.refresh_as_leader(credentials)
+            if refreshed is None:
+                refreshed = TokenRefresher.load_shared(credentials)
+            if refreshed is not None:
+                return refreshed
+            if time.monotonic() > deadline:
+                logger.error("Timed out waiting for a concurrent token refresh")
+                credentials.refresh(Request())
+                return credentials
+            time.sleep(0.05)
+
+    @staticmethod
+    def expires_soon(credentials):
+        return credentials.expiry is not None and (
+            credentials.expiry - datetime.utcnow()
+        ).total_seconds() < settings.GOOGLE_TOKEN_REFRESH_MARGIN
+
+    @staticmethod
+    def refresh_in_background(credentials):
+        """Refresh ahead of expiry so requests never wait on it"""
+        lock_key = TokenRefresher.key(credentials, 'refresh-lock')
+        if cache.get(lock_key):
+            return None
+        with TokenRefresher._pending_lock:
+            if lock_key in TokenRefresher._pending:
+                return None
+            TokenRefresher._pending.add(lock_key)
+        credentials = load_credentials(credentials.to_json())
+
+        def run():
+            try:
+                TokenRefresher.refresh_as_leader(credentials)
+            except Exception as e:
+                logger.error(f"Background token refresh error: {str(e)}")
+            finally:
+                with TokenRefresher._pending_lock:
+                    TokenRefresher._pending.discard(lock_key)
+                connection.close()
+
+        return TokenRefresher._executor.submit(run)
+
+StoredToken = namedtuple('StoredToken', 'credentials user_email email_expires')
+
+class CredentialStore:
+    """Per-user OAuth credentials in DriveToken, fronted by an in-process LRU
+
+    Requests carry the DriveToken id in a signed cookie, so neither the
+    session nor the token table is read while the decoded credentials are
+    cached. Entries are replaced whenever the token rotates. A user has one
+    row, kept across sign-ins, so every cookie they were given stays valid.
+    """
+
+    cookie_name = 'drive_token'
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self._tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get_token_id(self, request):
+        return request.get_signed_cookie(self.cookie_name, default=None, salt=self.cookie_name)
+
+    def set_cookie(self, response, token_id):
+        response.set_signed_cookie(
+            self.cookie_name,
+            str(token_id),
+            salt=self.cookie_name,
+            max_age=settings.GOOGLE_TOKEN_COOKIE_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            samesite=settings.SESSION_COOKIE_SAMESITE,
+            httponly=True
+        )
+
+    @staticmethod
+    def aware(value):
+        return value.replace(tzinfo=dt_timezone.utc) if value else None
+
+    def remember(self, token_id, stored):
+        with self._lock:
+            self._tokens[str(token_id)] = stored
+        return stored
+
+    def load(self, token_id):
+        with self._lock:
+            stored = self._tokens.get(str(token_id))
+        if stored is not None:
+            return stored
+
+        token = DriveToken.objects.filter(id=token_id).first()
+        if token is None:
+            return None
+        return self.remember(token_id, StoredToken(
+            load_credentials(token.credentials),
+            token.user_email,
+            token.email_expires
+        ))
+
+    def create(self, credentials, user_email, email_expires):
+        """Store the credentials of a new sign-in, reusing the user's row if there is one"""
+        values = {
+            'credentials': credentials.to_json(),
+            'expiry': self.aware(credentials.expiry),
+            'email_expires': email_expires
+        }
+        if user_email:
+            token, _ = DriveToken.objects.update_or_create(user_email=user_email, defaults=values)
+        else:
+            token = DriveToken.objects.create(**values)
+        self.remember(token.id, StoredToken(credentials, token.user_email, email_expires))
+        return token
+
+    def save_credentials(self, token_id, credentials):
+        """Persist a rotated token, the only time the row is written"""
+        DriveToken.objects.filter(id=token_id).update(
+            credentials=credentials.to_json(),
+            expiry=self.aware(credentials.expiry),
+            date_modification=timezone.now()
+        )
+        stored = self.load(token_id)
+        self.remember(token_id, stored._replace(credentials=credentials))
+
+    def save_email(self, token_id, user_email, email_expires):
+        with transaction.atomic():
+            if user_email:
+                # The row of an earlier sign-in is superseded by this one
+                DriveToken.objects.filter(user_email=user_email).exclude(id=token_id).delete()
+            DriveToken.objects.filter(id=token_id).update(
+                user_email=user_email or None,
+                email_expires=email_expires,
+                date_modification=timezone.now()
+            )
+        stored = self.load(token_id)
+        self.remember(token_id, stored._replace(user_email=user_email, email_expires=email_expires))
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+credential_store = CredentialStore(
+    maxsize=settings.GOOGLE_CREDENTIAL_CACHE_SIZE,
+    ttl=settings.GOOGLE_CREDENTIAL_CACHE_TTL
+)
+
 class GoogleDriveAuth:
     """Helper class for Google Drive authentication"""
     
     @staticmethod
     def get_credentials(request):
-        if 'credentials' not in request.session:
+        token_id = credential_store.get_token_id(request)
+        if token_id is None:
             return None
             
         try:
-            creds_info = json.loads(request.session['credentials'])
-            creds = Credentials.from_authorized_user_info(creds_info)
+            stored = credential_store.load(token_id)
+            if stored is None:
+                return None
+            request.drive_token_id = token_id
+            creds = stored.credentials
+            
+            # Another request may already have refreshed a token due for it
+            if creds.refresh_token and (not creds.valid or TokenRefresher.expires_soon(creds)):
+                shared = TokenRefresher.load_shared(creds)
+                if shared is not None:
+                    creds = shared
+                    credential_store.save_credentials(token_id, creds)
             
             if not creds.valid:
                 if creds.expired and creds.refresh_token:
-                    creds.refresh(Request())
-                    request.session['credentials'] = creds.to_json()
+                    # Refresh a copy, the cached object is shared between threads
+                    with span('credential_refresh'):
+                        creds = TokenRefresher.refresh(
+                            load_credentials(creds.to_json())
+                        )
+                    credential_store.save_credentials(token_id, creds)
                 else:
                     return None
+            elif creds.refresh_token and TokenRefresher.expires_soon(creds):
+                TokenRefresher.refresh_in_background(creds)
                     
             return creds
         except Exception as e:
@@ -44,7 +360,569 @@ class GoogleDriveAuth:
 
     @staticmethod
     def get_service(credentials):
-        return build('drive', 'v3', credentials=credentials)
+        return service_cache.get('drive', 'v3', credentials)
+
+    @staticmethod
+    def resolve_user_email(credentials):
+        """Read the email from the ID token, or fall back to one userinfo call"""
+        id_token = getattr(credentials, 'id_token', None)
+        if id_token:
+            # Received straight from the token endpoint over TLS
+            claims = jwt.decode(id_token, verify=False)
+            if claims.get('email'):
+                return claims['email']
+
+        service = service_cache.get('oauth2', 'v2', credentials)
+        user_info = service.userinfo().get().execute()
+        return user_info.get('email')
+
+    @staticmethod
+    def email_expiry(credentials):
+        expiry = credentials.expiry or (
+            datetime.utcnow() + timedelta(seconds=settings.GOOGLE_USER_EMAIL_TTL)
+        )
+        return CredentialStore.aware(expiry)
+
+    @staticmethod
+    def get_user_email(request, credentials):
+        """Return the email stored with the credentials until the token rotates"""
+        stored = credential_store.load(request.drive_token_id)
+        if stored.email_expires and stored.email_expires > timezone.now():
+            return stored.user_email
+
+        email = GoogleDriveAuth.resolve_user_email(credentials)
+        credential_store.save_email(
+            request.drive_token_id,
+            email,
+            GoogleDriveAuth.email_expiry(credentials)
+        )
+        return email
+
+class ResumableUpload:
+    """Helper class for chunked, resumable uploads to Google Drive"""
+
+    @staticmethod
+    def spool(uploaded_file, upload_id):
+        """Keep the uploaded content on disk so a restarted worker can resume"""
+        os.makedirs(settings.GOOGLE_DRIVE_UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(settings.GOOGLE_DRIVE_UPLOAD_DIR, str(upload_id))
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            file_move_safe(uploaded_file.temporary_file_path(), path)
+        else:
+            with open(path, 'wb') as fh:
+                for chunk in uploaded_file.chunks(settings.GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE):
+                    fh.write(chunk)
+        return path
+
+    @staticmethod
+    def create(uploaded_file, user_email, file_metadata):
+        upload = DriveUpload(
+            user_email=user_email,
+            name=file_metadata['name'],
+            mime_type=uploaded_file.content_type or 'application/octet-stream',
+            metadata=file_metadata,
+            total_size=uploaded_file.size
+        )
+        upload.path = ResumableUpload.spool(uploaded_file, upload.id)
+        upload.save()
+        return upload
+
+    @staticmethod
+    def query_progress(drive_request, upload):
+        """Ask Drive how many bytes of an interrupted session it has stored"""
+        with upstream_call(f'{drive_request.methodId}.progress'):
+            resp, content = drive_request.http.request(
+                upload.resumable_uri,
+                'PUT',
+                headers={
+                    'Content-Range': f'bytes */{upload.total_size}',
+                    'Content-Length': '0'
+                }
+            )
+        if resp.status in (200, 201):
+            return upload.total_size, json.loads(content)
+        if resp.status == 308:
+            received = resp.get('range')
+            if received:
+                return int(received.rsplit('-', 1)[1]) + 1, None
+            return 0, None
+        # The session expired, a new one has to be started
+        return None, None
+
+    @staticmethod
+    def run(service, upload):
+        """Send the spooled file in fixed-size chunks, recording progress"""
+        media = MediaFileUpload(
+            upload.path,
+            mimetype=upload.mime_type,
+            chunksize=settings.GOOGLE_DRIVE_UPLOAD_CHUNK_SIZE,
+            resumable=True
+        )
+        drive_request = service.files().create(
+            body=upload.metadata,
+            media_body=media,
+            fields='id'
+        )
+
+        response = None
+        if upload.resumable_uri:
+            progress, response = ResumableUpload.query_progress(drive_request, upload)
+            if progress is not None:
+                drive_request.resumable_uri = upload.resumable_uri
+                drive_request.resumable_progress = progress
+
+        upload.status = DriveUpload.STATUS_UPLOADING
+        upload.error = ''
+        try:
+            while response is None:
+                status, response = drive_request.next_chunk()
+                upload.resumable_uri = drive_request.resumable_uri or ''
+                upload.bytes_uploaded = drive_request.resumable_progress
+                upload.save(update_fields=[
+                    'resumable_uri', 'bytes_uploaded', 'status', 'error', 'date_modification'
+                ])
+        except Exception as e:
+            upload.status = DriveUpload.STATUS_FAILED
+            upload.error = str(e)
+            upload.save(update_fields=['status', 'error', 'date_modification'])
+            raise
+        finally:
+            media.stream().close()
+
+        upload.status = DriveUpload.STATUS_DONE
+        upload.bytes_uploaded = upload.total_size
+        upload.file_id = response.get('id', '')
+        upload.save()
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+        return response
+
+    @staticmethod
+    def to_dict(upload):
+        return {
+            'upload_id': str(upload.id),
+            'name': upload.name,
+            'status': upload.status,
+            'bytes_uploaded': upload.bytes_uploaded,
+            'total_size': upload.total_size,
+            'file_id': upload.file_id or None,
+            'error': upload.error or None
+        }
+
+class DriveBatch:
+    """Helper class running Drive calls as batch HTTP requests"""
+
+    @staticmethod
+    def execute(service, requests):
+        """Execute requests in batches, returning (response, exception) per request"""
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        credentials = DriveQuota.user_credentials(requests[0].http) if requests else None
+        size = settings.GOOGLE_DRIVE_BATCH_SIZE
+        for start in range(0, len(requests), size):
+            pending = list(range(start, min(start + size, len(requests))))
+            attempt = 0
+            while pending:
+                # Drive counts every call of a batch against the quota
+                DriveQuota.call(
+                    partial(DriveBatch.send, service, requests, pending, callback),
+                    credentials, 'batch', tokens=len(pending)
+                )
+                failed = [index for index in pending
+                          if DriveQuota.retry_reason(results[index][1])]
+                if not failed:
+                    break
+                delay = DriveQuota.retry_delay(results[failed[0]][1], attempt, 'batch')
+                if delay is None:
+                    break
+                with span('retry_backoff'):
+                    time.sleep(delay)
+                pending = failed
+                attempt += 1
+        return results
+
+    @staticmethod
+    def send(service, requests, indexes, callback):
+        batch = service.new_batch_http_request(callback=callback)
+        for index in indexes:
+            batch.add(requests[index], request_id=str(index))
+        with upstream_call('batch'):
+            batch.execute()
+
+    @staticmethod
+    def report(items, results):
+        return [
+            {
+                **item,
+                'success': exception is None,
+                'error': str(exception) if exception else None
+            }
+            for item, (response, exception) in zip(items, results)
+        ]
+
+class DrivePermissions:
+    """Helper class computing permission changes from a single snapshot"""
+
+    @staticmethod
+    def index(service, file_id):
+        """Map each grantee email to its permission, across all pages"""
+        index = {}
+        request = service.permissions().list(
+            fileId=file_id,
+            pageSize=100,
+            fields='nextPageToken, permissions(id,emailAddress,role)'
+        )
+        while request is not None:
+            response = request.execute()
+            for perm in response.get('permissions', []):
+                if perm.get('emailAddress'):
+                    index[perm['emailAddress'].lower()] = perm
+            request = service.permissions().list_next(request, response)
+        return index
+
+    @staticmethod
+    def diff(index, share_updates, remove_permissions):
+        """Return the grant, role change and revoke operations actually needed"""
+        changes = []
+        for update in share_updates:
+            email = update.get('email')
+            role = update.get('role', 'reader')
+            current = index.get((email or '').lower())
+            if current is None:
+                changes.append({'action': 'grant', 'email': email, 'role': role})
+            elif current.get('role') != role and current.get('role') != 'owner':
+                changes.append({
+                    'action': 'update',
+                    'email': email,
+                    'role': role,
+                    'permission_id': current['id']
+                })
+        for email in remove_permissions:
+            current = index.get(email.lower())
+            if current is not None and current.get('role') != 'owner':
+                changes.append({
+                    'action': 'revoke',
+                    'email': email,
+                    'permission_id': current['id']
+                })
+        return changes
+
+    @staticmethod
+    def request(service, file_id, change):
+        if change['action'] == 'grant':
+            return service.permissions().create(
+                fileId=file_id,
+                body={
+                    'type': 'user',
+                    'role': change['role'],
+                    'emailAddress': change['email']
+                },
+                sendNotificationEmail=True
+            )
+        if change['action'] == 'update':
+            return service.permissions().update(
+                fileId=file_id,
+                permissionId=change['permission_id'],
+                body={'role': change['role']}
+            )
+        return service.permissions().delete(
+            fileId=file_id,
+            permissionId=change['permission_id']
+        )
+
+class DriveMirror:
+    """Helper class keeping a local copy of a user's Drive metadata"""
+
+    file_fields = 'id, name, mimeType, createdTime, modifiedTime, owners, shared, trashed, version, capabilities(canEdit)'
+
+    @staticmethod
+    def to_row(user_email, file):
+        return DriveFile(
+            user_email=user_email,
+            file_id=file['id'],
+            name=file.get('name', ''),
+            mime_type=file.get('mimeType', ''),
+            created_time=parse_datetime(file['createdTime']) if file.get('createdTime') else None,
+            modified_time=parse_datetime(file['modifiedTime']) if file.get('modifiedTime') else None,
+            is_owner=any(owner.get('emailAddress') == user_email
+                         for owner in file.get('owners', [])),
+            can_edit=file.get('capabilities', {}).get('canEdit', False),
+            data=file
+        )
+
+    @staticmethod
+    def save(user_email, files):
+        DriveFile.objects.bulk_create(
+            [DriveMirror.to_row(user_email, file) for file in files],
+            update_conflicts=True,
+            unique_fields=['user_email', 'file_id'],
+            update_fields=['name', 'mime_type', 'created_time', 'modified_time',
+                           'is_owner', 'can_edit', 'data']
+        )
+
+    @staticmethod
+    def walk_files(service):
+        """Every file once, with the position the changes feed resumes from"""
+        start_page_token = service.changes().getStartPageToken().execute()['startPageToken']
+        files = []
+        request = service.files().list(
+            pageSize=1000,
+            q='trashed = false',
+            fields=f"nextPageToken, files({DriveMirror.file_fields})"
+        )
+        while request is not None:
+            response = request.execute()
+            files.extend(response.get('files', []))
+            request = service.files().list_next(request, response)
+        return start_page_token, files, None
+
+    @staticmethod
+    def walk_changes(service, page_token):
+        """Files changed and removed since page_token, with the next position"""
+        start_page_token = page_token
+        changed, removed = {}, set()
+        while page_token:
+            response = service.changes().list(
+                pageToken=page_token,
+                pageSize=1000,
+                fields=f"nextPageToken, newStartPageToken, "
+                       f"changes(fileId, removed, file({DriveMirror.file_fields}))"
+            ).execute()
+            for change in response.get('changes', []):
+                file_id = change['fileId']
+                if change.get('removed') or change.get('file', {}).get('trashed'):
+                    changed.pop(file_id, None)
+                    removed.add(file_id)
+                elif change.get('file'):
+                    removed.discard(file_id)
+                    changed[file_id] = change['file']
+            if 'newStartPageToken' in response:
+                start_page_token = response['newStartPageToken']
+            page_token = response.get('nextPageToken')
+        return start_page_token, list(changed.values()), removed
+
+    @staticmethod
+    def claim(user_email, max_age):
+        """Lock the sync state only to decide whether this request refreshes it"""
+        now = timezone.now()
+        with transaction.atomic():
+            state, created = DriveSyncState.objects.select_for_update().get_or_create(
+                user_email=user_email
+            )
+            if state.last_synced and state.last_synced >= now - timedelta(seconds=max_age):
+                return state, False
+            timeout = timedelta(seconds=settings.GOOGLE_DRIVE_MIRROR_SYNC_TIMEOUT)
+            if state.sync_started and state.sync_started >= now - timeout:
+                return state, False
+            state.sync_started = now
+            state.save(update_fields=['sync_started'])
+            return state, True
+
+    @staticmethod
+    def sync(service, state):
+        """Walk Drive without holding any lock, then write the rows at once"""
+        if state.start_page_token:
+            start_page_token, files, removed = DriveMirror.walk_changes(
+                service, state.start_page_token
+            )
+        else:
+            start_page_token, files, removed = DriveMirror.walk_files(service)
+
+        with transaction.atomic():
+            rows = DriveFile.objects.filter(user_email=state.user_email)
+            if removed is None:
+                rows.delete()
+            elif removed:
+                rows.filter(file_id__in=removed).delete()
+            DriveMirror.save(state.user_email, files)
+            state.start_page_token = start_page_token
+            state.last_synced = timezone.now()
+            state.sync_started = None
+            state.save(update_fields=['start_page_token', 'last_synced', 'sync_started'])
+
+    @staticmethod
+    def ensure_fresh(service, user_email, max_age):
+        """Sync the mirror unless it was synced less than max_age seconds ago
+
+        Returns None when the mirror cannot answer within max_age: the account
+        is unknown, or another request is still refreshing a stale copy.
+        """
+        if not user_email:
+            return None
+        state, claimed = DriveMirror.claim(user_email, max_age)
+        if claimed:
+            try:
+                DriveMirror.sync(service, state)
+            except Exception:
+                DriveSyncState.objects.filter(
+                    pk=state.pk, sync_started=state.sync_started
+                ).update(sync_started=None)
+                raise
+            return state
+        if state.last_synced and state.last_synced >= timezone.now() - timedelta(seconds=max_age):
+            return state
+        return None
+
+    @staticmethod
+    def get_max_age(request):
+        """Freshness bound in seconds requested by the caller, None to go live"""
+        max_age = request.GET.get('max_age', settings.GOOGLE_DRIVE_MIRROR_MAX_AGE)
+        if max_age is None:
+            return None
+        return int(max_age)
+
+class FileState:
+    """Ownership and version of files as last read by each user"""
+
+    @staticmethod
+    def key(user_email, file_id):
+        digest = hashlib.sha256(f'{user_email}:{file_id}'.encode()).hexdigest()
+        return f'drive:file-state:{digest}'
+
+    @staticmethod
+    def etag(version):
+        return f'"{version}"'
+
+    @staticmethod
+    def state(user_email, file):
+        if not {'id', 'owners', 'version'} <= file.keys():
+            return None
+        return {
+            'is_owner': any(owner.get('emailAddress') == user_email
+                            for owner in file['owners']),
+            'version': file['version']
+        }
+
+    @staticmethod
+    def remember(user_email, file, timeout=None):
+        """Record the state of a file resource read with owners and version"""
+        state = FileState.state(user_email, file)
+        if state is not None:
+            cache.set(FileState.key(user_email, file['id']), state,
+                      timeout=settings.GOOGLE_FILE_STATE_TTL if timeout is None else timeout)
+        return state
+
+    @staticmethod
+    def remember_many(user_email, files):
+        states = {}
+        for file in files:
+            state = FileState.state(user_email, file)
+            if state is not None:
+                states[FileState.key(user_email, file['id'])] = state
+        cache.set_many(states, timeout=settings.GOOGLE_FILE_STATE_TTL)
+
+    @staticmethod
+    def forget(user_email, file_id):
+        cache.delete(FileState.key(user_email, file_id))
+
+    @staticmethod
+    def get(service, user_email, file_id):
+        """Cached state, then the local mirror, then a live fetch on a miss"""
+        state = cache.get(FileState.key(user_email, file_id))
+        if state is not None:
+            return state
+
+        # The mirror only stands in for Drive while it is as fresh as a cached state
+        last_synced = DriveSyncState.objects.filter(
+            user_email=user_email
+        ).values_list('last_synced', flat=True).first()
+        age = (timezone.now() - last_synced).total_seconds() if last_synced else None
+        if age is not None and age < settings.GOOGLE_FILE_STATE_TTL:
+            row = DriveFile.objects.filter(user_email=user_email, file_id=file_id).first()
+            if row is not None and 'version' in row.data:
+                return FileState.remember(
+                    user_email, row.data,
+                    timeout=max(int(settings.GOOGLE_FILE_STATE_TTL - age), 1)
+                )
+
+        file = service.files().get(fileId=file_id, fields='id, owners, version').execute()
+        return FileState.remember(user_email, file)
+
+    @staticmethod
+    def matches(if_match, state):
+        if if_match.strip() == '*':
+            return True
+        return FileState.etag(state['version']) in [
+            tag.strip().removeprefix('W/') for tag in if_match.split(',')
+        ]
+
+    @staticmethod
+    def check_write(service, user_email, request, file_id, action):
+        """Ownership and If-Match check from the last known file state, an error response or None"""
+        state = FileState.get(service, user_email, file_id)
+        if not state['is_owner']:
+            return JsonResponse(
+                {'error': f'You do not have permission to {action} this file'},
+                status=403
+            )
+        if_match = request.META.get('HTTP_IF_MATCH')
+        if if_match and not FileState.matches(if_match, state):
+            return JsonResponse(
+                {'error': 'The file has changed since it was read'},
+                status=412
+            )
+        return None
+
+class FileMetadata:
+    """Per-user cache of files.get and permissions.list responses
+
+    One cache entry per user and file holds the response of each call and
+    field mask read, so a write through this API replaces or drops them
+    all at once. Changes made elsewhere show after GOOGLE_FILE_METADATA_TTL.
+    """
+
+    # Field mask of the file resources the sync and async writes return
+    FIELDS = 'id, name, mimeType, createdTime, owners, version'
+
+    @staticmethod
+    def key(user_email, file_id):
+        digest = hashlib.sha256(f'{user_email}:{file_id}'.encode()).hexdigest()
+        return f'drive:file-metadata:{digest}'
+
+    @staticmethod
+    def get(user_email, file_id, call, fields, load):
+        """Response of call with the fields mask, from the cache or from load() on a miss"""
+        if user_email is None:
+            return load()
+        key = FileMetadata.key(user_email, file_id)
+        mask = f'{call}:{fields}'
+        entry = cache.get(key) or {}
+        cached = entry.get(mask)
+        if cached is not None and time.time() - cached[0] < settings.GOOGLE_FILE_METADATA_TTL:
+            registry.increment('drive_metadata_cache_requests_total', {'call': call, 'result': 'hit'})
+            return cached[1]
+
+        registry.increment('drive_metadata_cache_requests_total', {'call': call, 'result': 'miss'})
+        response = load()
+        entry[mask] = (time.time(), response)
+        cache.set(key, entry, timeout=settings.GOOGLE_FILE_METADATA_TTL)
+        return response
+
+    @staticmethod
+    def replace(user_email, file_id, call, fields, response):
+        """Keep only the response of a write, dropping every other cached call"""
+        if user_email is not None:
+            cache.set(FileMetadata.key(user_email, file_id),
+                      {f'{call}:{fields}': (time.time(), response)},
+                      timeout=settings.GOOGLE_FILE_METADATA_TTL)
+
+    @staticmethod
+    def forget(user_email, file_id):
+        cache.delete(FileMetadata.key(user_email, file_id))
+
+    @staticmethod
+    def updated(user_email, file):
+        """Refresh the cached state and metadata of a file from a write read with FIELDS"""
+        FileState.remember(user_email, file)
+        FileMetadata.replace(user_email, file['id'], 'files.get', FileMetadata.FIELDS, file)
+
+    @staticmethod
+    def deleted(user_email, file_id):
+        FileState.forget(user_email, file_id)
+        FileMetadata.forget(user_email, file_id)
 
 class DriveAuthView(View):
     """Handle Google Drive OAuth flow"""
@@ -80,8 +958,14 @@ class DriveCallbackView(View):
             )
             flow.fetch_token(authorization_response=request.build_absolute_uri())
             credentials = flow.credentials
-            request.session['credentials'] = credentials.to_json()
-            return redirect('/drive/list/')
+            token = credential_store.create(
+                credentials,
+                GoogleDriveAuth.resolve_user_email(credentials),
+                GoogleDriveAuth.email_expiry(credentials)
+            )
+            response = redirect('/drive/list/')
+            credential_store.set_cookie(response, token.id)
+            return response
             
         except Exception as e:
             logger.error(f"Callback error: {str(e)}")
@@ -95,40 +979,158 @@ class BaseGoogleDriveView(View):
             return redirect('/drive/auth/')
         
         try:
-            service = build('oauth2', 'v2', credentials=self.credentials)
-            user_info = service.userinfo().get().execute()
-            self.user_email = user_info.get('email')
+            self.user_email = GoogleDriveAuth.get_user_email(request, self.credentials)
+        except DriveRateLimited as e:
+            return rate_limited(e)
         except Exception as e:
             logger.error(f"Error getting user email: {str(e)}")
             self.user_email = None
             
-        return super().dispatch(request, *args, **kwargs)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except DriveRateLimited as e:
+            return rate_limited(e)
+    
+    def check_write(self, service, request, file_id, action):
+        return FileState.check_write(service, self.user_email, request, file_id, action)
 
 @method_decorator(csrf_exempt, name='dispatch')
 class DriveListFilesView(BaseGoogleDriveView):
     """Handle listing files"""
     
+    default_fields = 'id, name, mimeType, createdTime, owners, shared, version'
+    
+    def get_list_params(self, request):
+        try:
+            page_size = int(request.GET.get('page_size', settings.GOOGLE_DRIVE_PAGE_SIZE))
+        except ValueError:
+            raise ValueError('page_size must be an integer')
+        if not 1 <= page_size <= settings.GOOGLE_DRIVE_MAX_PAGE_SIZE:
+            raise ValueError(
+                f"page_size must be between 1 and {settings.GOOGLE_DRIVE_MAX_PAGE_SIZE}"
+            )
+        
+        fields = request.GET.get('fields', self.default_fields)
+        if not re.fullmatch(r'[\w\s,/()]+', fields):
+            raise ValueError('Invalid fields mask')
+        self.include_owners = 'owners' in fields
+        self.mask_keys = [
+            key.strip() for key in re.sub(r'\([^)]*\)', '', fields).split(',') if key.strip()
+        ]
+        if not self.include_owners:
+            # Needed for is_owner, dropped from the response again
+            fields = f"{fields}, owners(emailAddress)"
+        
+        params = {
+            'pageSize': page_size,
+            'fields': f"nextPageToken, files({fields})",
+            'q': f"'me' in owners or '{self.user_email}' in writers"
+        }
+        if request.GET.get('page_token'):
+            params['pageToken'] = request.GET['page_token']
+        return params
+    
+    def annotate(self, files):
+        FileState.remember_many(self.user_email, files)
+        for file in files:
+            file['user_email'] = self.user_email
+            file['is_owner'] = any(owner.get('emailAddress') == self.user_email 
+                                 for owner in file.get('owners', []))
+            if 'version' in file:
+                file['etag'] = FileState.etag(file['version'])
+            if not self.include_owners:
+                file.pop('owners', None)
+        return files
+    
+    def live_pages(self, service, params):
+        list_request = service.files().list(**params)
+        while list_request is not None:
+            results = list_request.execute()
+            yield results.get('files', [])
+            list_request = service.files().list_next(list_request, results)
+    
+    def mirror_queryset(self):
+        return DriveFile.objects.filter(
+            Q(is_owner=True) | Q(can_edit=True),
+            user_email=self.user_email
+        ).order_by('file_id')
+    
+    def from_mirror(self, rows):
+        return [
+            {key: row.data[key] for key in self.mask_keys + ['owners'] if key in row.data}
+            for row in rows
+        ]
+    
+    def mirror_pages(self, params):
+        rows = []
+        for row in self.mirror_queryset().iterator(chunk_size=params['pageSize']):
+            rows.append(row)
+            if len(rows) == params['pageSize']:
+                yield self.from_mirror(rows)
+                rows = []
+        yield self.from_mirror(rows)
+    
+    def mirror_page(self, params):
+        """One page from the mirror, keyed on file id"""
+        queryset = self.mirror_queryset()
+        if params.get('pageToken'):
+            queryset = queryset.filter(file_id__gt=params['pageToken'])
+        rows = list(queryset[:params['pageSize'] + 1])
+        next_page_token = None
+        if len(rows) > params['pageSize']:
+            rows = rows[:params['pageSize']]
+            next_page_token = rows[-1].file_id
+        return {'files': self.from_mirror(rows), 'nextPageToken': next_page_token}
+    
+    def stream(self, pages):
+        """Walk every page, emitting the files as one JSON array"""
+        first = True
+        yield b'['
+        try:
+            for files in pages:
+                for file in self.annotate(files):
+                    yield (b'' if first else b',') + dumps(file)
+                    first = False
+        except Exception as e:
+            logger.error(f"File listing stream error: {str(e)}")
+            raise
+        yield b']'
+    
     def get(self, request):
+        try:
+            params = self.get_list_params(request)
+            max_age = DriveMirror.get_max_age(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
         try:
             service = GoogleDriveAuth.get_service(self.credentials)
-            query = f"'me' in owners or '{self.user_email}' in writers"
-            results = service.files().list(
-                pageSize=10,
-                fields="files(id, name, mimeType, createdTime, owners, shared)",
-                q=query
-            ).execute()
+            mirrored = (max_age is not None and
+                        DriveMirror.ensure_fresh(service, self.user_email, max_age) is not None)
             
-            files = results.get('files', [])
-            for file in files:
-                file['user_email'] = self.user_email
-                file['is_owner'] = any(owner.get('emailAddress') == self.user_email 
-                                     for owner in file.get('owners', []))
+            if request.GET.get('stream') in ('1', 'true'):
+                if mirrored:
+                    pages = self.mirror_pages(params)
+                else:
+                    pages = self.live_pages(service, params)
+                return StreamingHttpResponse(
+                    self.stream(pages),
+                    content_type='application/json'
+                )
+            
+            if mirrored:
+                results = self.mirror_page(params)
+            else:
+                results = service.files().list(**params).execute()
             
             return JsonResponse({
-                'files': files,
+                'files': self.annotate(results.get('files', [])),
+                'next_page_token': results.get('nextPageToken'),
                 'user_email': self.user_email
             })
             
+        except DriveRateLimited:
+            raise
         except Exception as e:
             logger.error(f"File listing error: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -137,13 +1139,40 @@ class DriveListFilesView(BaseGoogleDriveView):
 class DriveFileDetailView(BaseGoogleDriveView):
     """Handle getting file details"""
     
+    fields = ['id', 'name', 'mimeType', 'createdTime', 'owners', 'version']
+    
     def get(self, request, file_id):
+        try:
+            max_age = DriveMirror.get_max_age(request)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
         try:
             service = GoogleDriveAuth.get_service(self.credentials)
-            file = service.files().get(
-                fileId=file_id,
-                fields='id, name, mimeType, createdTime, owners'
-            ).execute()
+            file = None
+            if (max_age is not None and
+                    DriveMirror.ensure_fresh(service, self.user_email, max_age) is not None):
+                row = DriveFile.objects.filter(
+                    user_email=self.user_email,
+                    file_id=file_id
+                ).first()
+                if row is not None:
+                    file = {key: row.data[key] for key in self.fields if key in row.data}
+            if file is None:
+                fields = ', '.join(self.fields)
+                file = FileMetadata.get(
+                    self.user_email, file_id, 'files.get', fields,
+                    lambda: service.files().get(fileId=file_id, fields=fields).execute()
+                )
+            
+            state = FileState.remember(self.user_email, file)
+            if state is not None:
+                etag = FileState.etag(state['version'])
+                if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+                if if_none_match and FileState.matches(if_none_match, state):
+                    response = HttpResponseNotModified()
+                    response['ETag'] = etag
+                    return response
             
             response_data = {
                 **file,
@@ -151,8 +1180,13 @@ class DriveFileDetailView(BaseGoogleDriveView):
                 'is_owner': any(owner.get('emailAddress') == self.user_email 
                               for owner in file.get('owners', []))
             }
-            return JsonResponse(response_data)
+            response = JsonResponse(response_data)
+            if state is not None:
+                response['ETag'] = etag
+            return response
             
+        except DriveRateLimited:
+            raise
         except Exception as e:
             logger.error(f"File detail error: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -172,42 +1206,62 @@ class DriveFileCreateView(BaseGoogleDriveView):
             
             share_with = request.POST.getlist('share_with', [])
             
+            upload = None
             if 'file' in request.FILES:
-                media = MediaFileUpload(
+                # Uploads are recorded under the account they belong to
+                if not self.user_email:
+                    return JsonResponse(
+                        {'error': 'The Google account of these credentials is unknown, sign in again'},
+                        status=403
+                    )
+                upload = ResumableUpload.create(
                     request.FILES['file'],
-                    mimetype=request.FILES['file'].content_type,
-                    resumable=True
+                    self.user_email,
+                    file_metadata
                 )
-                file = service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id'
-                ).execute()
+                try:
+                    file = ResumableUpload.run(service, upload)
+                except DriveRateLimited as e:
+                    return rate_limited(e, upload=ResumableUpload.to_dict(upload))
+                except Exception as e:
+                    logger.error(f"File upload error: {str(e)}")
+                    return JsonResponse({
+                        'error': str(e),
+                        'upload': ResumableUpload.to_dict(upload)
+                    }, status=500)
             else:
                 file = service.files().create(
                     body=file_metadata,
                     fields='id'
                 ).execute()
             
-            for email in share_with:
-                permission = {
-                    'type': 'user',
-                    'role': 'writer',
-                    'emailAddress': email
-                }
+            FileMetadata.forget(self.user_email, file.get('id'))
+            
+            grants = [{'action': 'grant', 'email': email, 'role': 'writer'} for email in share_with]
+            results = DriveBatch.execute(service, [
                 service.permissions().create(
                     fileId=file.get('id'),
-                    body=permission,
+                    body={
+                        'type': 'user',
+                        'role': grant['role'],
+                        'emailAddress': grant['email']
+                    },
                     sendNotificationEmail=True
-                ).execute()
+                )
+                for grant in grants
+            ])
             
             return JsonResponse({
                 'message': 'File created successfully',
                 'file_id': file.get('id'),
                 'shared_with': share_with,
-                'owner_email': self.user_email
+                'permission_results': DriveBatch.report(grants, results),
+                'owner_email': self.user_email,
+                'upload': ResumableUpload.to_dict(upload) if upload else None
             })
             
+        except DriveRateLimited:
+            raise
         except Exception as e:
             logger.error(f"File creation error: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -215,14 +1269,18 @@ class DriveFileCreateView(BaseGoogleDriveView):
 class DriveFileUpdateView(BaseGoogleDriveView):
     """Handle file updates"""
     
+    fields = FileMetadata.FIELDS
+    permission_fields = 'permissions(id,emailAddress,role)'
+    
     def get(self, request, file_id):
         """Get file update form"""
         try:
             service = GoogleDriveAuth.get_service(self.credentials)
-            file = service.files().get(
-                fileId=file_id,
-                fields='id, name, mimeType, createdTime, owners'
-            ).execute()
+            file = FileMetadata.get(
+                self.user_email, file_id, 'files.get', self.fields,
+                lambda: service.files().get(fileId=file_id, fields=self.fields).execute()
+            )
+            FileState.remember(self.user_email, file)
             
             # Check ownership
             if not any(owner.get('emailAddress') == self.user_email 
@@ -233,18 +1291,25 @@ class DriveFileUpdateView(BaseGoogleDriveView):
                 )
             
             # Get current sharing settings
-            permissions = service.permissions().list(
-                fileId=file_id,
-                fields='permissions(id,emailAddress,role)'
-            ).execute()
+            permissions = FileMetadata.get(
+                self.user_email, file_id, 'permissions.list', self.permission_fields,
+                lambda: service.permissions().list(
+                    fileId=file_id,
+                    fields=self.permission_fields
+                ).execute()
+            )
             
             response_data = {
                 **file,
                 'user_email': self.user_email,
                 'permissions': permissions.get('permissions', [])
             }
-            return JsonResponse(response_data)
+            response = JsonResponse(response_data)
+            response['ETag'] = FileState.etag(file['version'])
+            return response
             
+        except DriveRateLimited:
+            raise
         except Exception as e:
             logger.error(f"File update form error: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -255,18 +1320,11 @@ class DriveFileUpdateView(BaseGoogleDriveView):
             service = GoogleDriveAuth.get_service(self.credentials)
             data = json.loads(request.body)
             
-            # Check ownership
-            file = service.files().get(
-                fileId=file_id, 
-                fields='owners'
-            ).execute()
-            
-            if not any(owner.get('emailAddress') == self.user_email 
-                      for owner in file.get('owners', [])):
-                return JsonResponse(
-                    {'error': 'You do not have permission to modify this file'}, 
-                    status=403
-                )
+            # Check ownership and the client's If-Match
+            error = self.check_write(service, request, file_id, 'modify')
+            if error:
+                return error
+            FileMetadata.forget(self.user_email, file_id)
             
             # Update file metadata
             file_metadata = {
@@ -274,49 +1332,40 @@ class DriveFileUpdateView(BaseGoogleDriveView):
                 'description': data.get('description', '')
             }
             
-            # Update sharing settings
+            # Update sharing settings, applying only the real changes
             share_updates = data.get('share_updates', [])
-            for update in share_updates:
-                permission = {
-                    'type': 'user',
-                    'role': update.get('role', 'reader'),
-                    'emailAddress': update.get('email')
-                }
-                service.permissions().create(
-                    fileId=file_id,
-                    body=permission,
-                    sendNotificationEmail=True
-                ).execute()
-            
-            # Remove permissions if specified
             remove_permissions = data.get('remove_permissions', [])
-            for email in remove_permissions:
-                # Find and delete permission by email
-                permissions = service.permissions().list(
-                    fileId=file_id,
-                    fields='permissions(id,emailAddress)'
-                ).execute()
-                
-                for perm in permissions.get('permissions', []):
-                    if perm.get('emailAddress') == email:
-                        service.permissions().delete(
-                            fileId=file_id,
-                            permissionId=perm['id']
-                        ).execute()
+            changes = []
+            requests = []
+            if share_updates or remove_permissions:
+                index = DrivePermissions.index(service, file_id)
+                changes = DrivePermissions.diff(index, share_updates, remove_permissions)
+                requests = [
+                    DrivePermissions.request(service, file_id, change)
+                    for change in changes
+                ]
+            
+            results = DriveBatch.execute(service, requests)
             
             # Update file
             updated_file = service.files().update(
                 fileId=file_id,
                 body=file_metadata,
-                fields='id, name, mimeType, createdTime, owners'
+                fields=self.fields
             ).execute()
+            FileMetadata.updated(self.user_email, updated_file)
             
-            return JsonResponse({
+            response = JsonResponse({
                 'message': 'File updated successfully',
                 'file': updated_file,
+                'permission_results': DriveBatch.report(changes, results),
                 'owner_email': self.user_email
             })
+            response['ETag'] = FileState.etag(updated_file['version'])
+            return response
             
+        except DriveRateLimited:
+            raise
         except Exception as e:
             logger.error(f"File update error: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
@@ -328,27 +1377,57 @@ class DriveFileDeleteView(BaseGoogleDriveView):
         try:
             service = GoogleDriveAuth.get_service(self.credentials)
             
-            file = service.files().get(
-                fileId=file_id, 
-                fields='owners'
-            ).execute()
-            
-            if not any(owner.get('emailAddress') == self.user_email 
-                      for owner in file.get('owners', [])):
-                return JsonResponse(
-                    {'error': 'You do not have permission to delete this file'}, 
-                    status=403
-                )
+            error = self.check_write(service, request, file_id, 'delete')
+            if error:
+                return error
             
             service.files().delete(fileId=file_id).execute()
+            FileMetadata.deleted(self.user_email, file_id)
             return JsonResponse({
                 'message': 'File deleted successfully',
                 'owner_email': self.user_email
             })
             
+        except DriveRateLimited:
+            raise
         except Exception as e:
             logger.error(f"File deletion error: {str(e)}")
             return JsonResponse({'error': str(e)}, status=500)
+@method_decorator(csrf_exempt, name='dispatch')
+class DriveUploadStatusView(BaseGoogleDriveView):
+    """Report and resume chunked uploads"""
+    
+    def get_upload(self, upload_id):
+        return DriveUpload.objects.filter(id=upload_id, user_email=self.user_email).first()
+    
+    def get(self, request, upload_id):
+        upload = self.get_upload(upload_id)
+        if upload is None:
+            return JsonResponse({'error': 'Upload not found'}, status=404)
+        return JsonResponse(ResumableUpload.to_dict(upload))
+    
+    def post(self, request, upload_id):
+        """Resume an interrupted upload"""
+        upload = self.get_upload(upload_id)
+        if upload is None:
+            return JsonResponse({'error': 'Upload not found'}, status=404)
+        if upload.status == DriveUpload.STATUS_DONE:
+            return JsonResponse(ResumableUpload.to_dict(upload))
+        
+        try:
+            service = GoogleDriveAuth.get_service(self.credentials)
+            ResumableUpload.run(service, upload)
+            return JsonResponse(ResumableUpload.to_dict(upload))
+            
+        except DriveRateLimited as e:
+            return rate_limited(e, upload=ResumableUpload.to_dict(upload))
+        except Exception as e:
+            logger.error(f"Upload resume error: {str(e)}")
+            return JsonResponse({
+                'error': str(e),
+                'upload': ResumableUpload.to_dict(upload)
+            }, status=500)
+
 class DriveDownloadView(View):
     """Handle file downloads"""
     
@@ -361,25 +1440,103 @@ class DriveDownloadView(View):
             service = GoogleDriveAuth.get_service(credentials)
             
             # Get file metadata
-            file = service.files().get(fileId=file_id).execute()
+            file = service.files().get(
+                fileId=file_id,
+                fields='name, mimeType, size, md5Checksum, version'
+            ).execute()
             file_name = file.get('name', 'downloaded_file')
+            content_type = file.get('mimeType') or 'application/octet-stream'
+            
+            # Serve whole files from the local cache, ranges come from Drive
+            key = None if 'HTTP_RANGE' in request.META else download_cache.key(file_id, file)
+            if key is not None:
+                cached = download_cache.open(key)
+                if cached is not None:
+                    registry.increment('drive_download_cache_requests_total', {'result': 'hit'})
+                    return self.attachment(FileResponse(cached, content_type=content_type), file_name)
+                fill = download_cache.join(key)
+                if fill is not None:
+                    registry.increment('drive_download_cache_requests_total', {'result': 'join'})
+                    return self.from_fill(fill, content_type, file_name)
+            
+            # Relay the content from Drive as it arrives
+            headers = {'Accept-Encoding': 'identity'}
+            if 'HTTP_RANGE' in request.META:
+                headers['Range'] = request.META['HTTP_RANGE']
+            session = AuthorizedSession(credentials)
+            media_uri = service.files().get_media(fileId=file_id).uri
             
-            # Download file content
-            request = service.files().get_media(fileId=file_id)
-            fh = BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
+            def fetch():
+                with upstream_call('drive.files.get_media'):
+                    upstream = session.get(media_uri, headers=headers, stream=True)
+                if upstream.status_code in RETRY_STATUSES:
+                    upstream.close()
+                    resp = httplib2.Response({
+                        'status': str(upstream.status_code),
+                        'retry-after': upstream.headers.get('Retry-After', '')
+                    })
+                    raise HttpError(resp, b'', uri=media_uri)
+                return upstream
             
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
+            try:
+                upstream = DriveQuota.call(fetch, credentials, 'drive.files.get_media')
+            except Exception:
+                session.close()
+                raise
+            if upstream.status_code not in (200, 206):
+                upstream.close()
+                session.close()
+                return JsonResponse(
+                    {'error': f"Drive download failed with status {upstream.status_code}"},
+                    status=upstream.status_code
+                )
+            if key is not None and upstream.status_code == 200:
+                fill = download_cache.fill(key, upstream, session, int(file['size']))
+                if fill is not None:
+                    registry.increment('drive_download_cache_requests_total', {'result': 'miss'})
+                    return self.from_fill(fill, content_type, file_name)
+            
+            def stream():
+                try:
+                    yield from upstream.iter_content(
+                        chunk_size=settings.GOOGLE_DRIVE_DOWNLOAD_CHUNK_SIZE
+                    )
+                finally:
+                    upstream.close()
+                    session.close()
             
             # Prepare response
-            fh.seek(0)
-            response = HttpResponse(fh.read(), content_type='application/octet-stream')
-            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+            response = StreamingHttpResponse(
+                stream(),
+                status=upstream.status_code,
+                content_type=content_type
+            )
+            if 'Content-Range' in upstream.headers:
+                response['Content-Range'] = upstream.headers['Content-Range']
+            content_length = upstream.headers.get('Content-Length')
+            if content_length is None and upstream.status_code == 200:
+                content_length = file.get('size')
+            if content_length is not None:
+                response['Content-Length'] = content_length
             
-            return response
+            return self.attachment(response, file_name)
             
+        except DriveRateLimited as e:
+            return rate_limited(e)
         except Exception as e:
             logger.error(f"Download error: {str(e)}")
-            return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+            return JsonResponse({'error': str(e)}, status=500)
+    
+    def from_fill(self, fill, content_type, file_name):
+        """Stream a file as it is written into the download cache"""
+        response = StreamingHttpResponse(
+            fill.stream(settings.GOOGLE_DRIVE_DOWNLOAD_CHUNK_SIZE),
+            content_type=content_type
+        )
+        response['Content-Length'] = fill.size
+        return self.attachment(response, file_name)
+    
+    def attachment(self, response, file_name):
+        response['Accept-Ranges'] = 'bytes'
+        response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+        return response
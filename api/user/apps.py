@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
+
+    def ready(self):
+        # Connects the access token cache invalidation handlers and the
+        # last_modified bump on relation changes
+        from . import authentication, signals  # noqa: F401
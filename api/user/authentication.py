@@ -0,0 +1,88 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from oauth2_provider.contrib.rest_framework import OAuth2Authentication
+from oauth2_provider.models import get_access_token_model
+from api.cache import is_shared
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+AccessToken = get_access_token_model()
+
+
+class CachedOAuth2Authentication(OAuth2Authentication):
+    """OAuth2Authentication that remembers validated access tokens
+
+    Tokens are cached with their application and user under the sha256 of
+    the token, the checksum the toolkit stores, for at most
+    OAUTH2_TOKEN_CACHE_TTL seconds and never past their expiry. Saving or
+    deleting a token, which is how the toolkit revokes it, or saving its
+    user drops the entry. That only reaches other workers through a shared
+    cache, so with a process-local one OAUTH2_TOKEN_LOCAL_CACHE_TTL applies.
+    When the cache is unavailable tokens are validated against the database.
+    """
+
+    @staticmethod
+    def key(token_checksum):
+        return f'oauth2:access-token:{token_checksum}'
+
+    @staticmethod
+    def get_bearer_token(request):
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(auth) == 2 and auth[0].lower() == 'bearer':
+            return auth[1]
+        return None
+
+    def authenticate(self, request):
+        token = self.get_bearer_token(request) if request is not None else None
+        if token is None:
+            return super().authenticate(request)
+
+        key = self.key(hashlib.sha256(token.encode('utf-8')).hexdigest())
+        try:
+            access_token = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Access token cache unavailable: {str(e)}")
+            return super().authenticate(request)
+        if access_token is not None and not access_token.is_expired():
+            return access_token.user, access_token
+
+        result = super().authenticate(request)
+        if result is not None:
+            self.remember(key, result[1])
+        return result
+
+    def remember(self, key, access_token):
+        ttl = min(
+            settings.OAUTH2_TOKEN_CACHE_TTL if is_shared() else settings.OAUTH2_TOKEN_LOCAL_CACHE_TTL,
+            (access_token.expires - timezone.now()).total_seconds()
+        )
+        if ttl >= 1:
+            try:
+                cache.set(key, access_token, timeout=int(ttl))
+            except Exception as e:
+                logger.warning(f"Access token cache unavailable: {str(e)}")
+
+
+def forget(checksums):
+    try:
+        cache.delete_many([CachedOAuth2Authentication.key(checksum) for checksum in checksums])
+    except Exception as e:
+        logger.error(f"Could not drop cached access tokens: {str(e)}")
+
+
+@receiver([post_save, post_delete], sender=AccessToken)
+def forget_access_token(sender, instance, **kwargs):
+    forget([instance.token_checksum])
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_access_tokens(sender, instance, created, **kwargs):
+    if created:
+        return
+    forget(AccessToken.objects.filter(user=instance).values_list('token_checksum', flat=True))
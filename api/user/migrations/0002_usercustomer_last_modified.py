@@ -0,0 +1,18 @@
+# Generated by Django 4.2.19 on 2026-10-18 08:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercustomer',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
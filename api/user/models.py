@@ -3,4 +3,6 @@ from django.contrib.auth.models import AbstractUser
 
 # Create your models here.
 class UserCustomer(AbstractUser):
-    description = models.TextField(max_length=500,blank=True)
\ No newline at end of file
+    description = models.TextField(max_length=500,blank=True)
+    # Exact time of the last save, the validator for conditional reads
+    last_modified = models.DateTimeField(auto_now=True, editable=False)
\ No newline at end of file
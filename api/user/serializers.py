@@ -4,4 +4,26 @@ from django.contrib.auth import authenticate
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserCustomer
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['last_modified']
+class UserListSerializer(serializers.ModelSerializer):
+    """Read-only user representation for listings, without the password hash
+
+    Pass fields=[...] to serialize only a subset of the fields.
+    """
+    groups = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    user_permissions = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = UserCustomer
+        fields = [
+            'id', 'username', 'email', 'first_name', 'last_name', 'description',
+            'is_active', 'is_staff', 'is_superuser', 'date_joined', 'last_login',
+            'groups', 'user_permissions'
+        ]
+        read_only_fields = fields
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
@@ -0,0 +1,38 @@
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .models import UserCustomer
+
+
+def user_field(through):
+    return next(field.name for field in through._meta.fields if field.related_model is UserCustomer)
+
+
+@receiver(m2m_changed, sender=UserCustomer.groups.through)
+@receiver(m2m_changed, sender=UserCustomer.user_permissions.through)
+def touch_users(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump last_modified of users whose groups or permissions changed
+
+    Relation changes do not save the user, and last_modified is the
+    validator of conditional user reads.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.last_modified = timezone.now()
+            UserCustomer.objects.filter(pk=instance.pk).update(last_modified=instance.last_modified)
+        return
+
+    # The group or permission side: pk_set holds users, except on clear
+    if action == 'pre_clear':
+        field = user_field(sender)
+        other = next(f.name for f in sender._meta.fields if f.is_relation and f.name != field)
+        instance._cleared_user_ids = list(
+            sender.objects.filter(**{other: instance.pk}).values_list(f'{field}_id', flat=True)
+        )
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_user_ids', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if pk_set:
+        UserCustomer.objects.filter(pk__in=pk_set).update(last_modified=timezone.now())
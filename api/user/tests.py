@@ -1,3 +1,117 @@
-from django.test import TestCase
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken, Application
+from rest_framework.test import APIClient
+from user.models import UserCustomer
+from datetime import timedelta
 
 # Create your tests here.
+class UserListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        groups = [Group.objects.create(name=f'group-{i}') for i in range(3)]
+        permissions = list(Permission.objects.all()[:3])
+        for i in range(25):
+            user = UserCustomer.objects.create_user(username=f'user-{i}', password='secret')
+            user.groups.set(groups)
+            user.user_permissions.set(permissions)
+        cls.admin = UserCustomer.objects.get(username='user-0')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # One query for the users and one per prefetched relation
+        for page_size in (1, 10, 25):
+            with self.assertNumQueries(3):
+                response = self.client.get('/user/user-list/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+            self.assertEqual(len(response.data['results'][0]['groups']), 3)
+
+    def test_password_is_not_exposed(self):
+        response = self.client.get('/user/user-list/')
+        self.assertNotIn('password', response.data['results'][0])
+
+    def test_fields_selection(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/user/user-list/', {'fields': 'username,email'})
+        self.assertEqual(set(response.data['results'][0]), {'username', 'email'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get('/user/user-list/', {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_walks_every_user_once(self):
+        seen = []
+        params = {'page_size': 7, 'fields': 'id'}
+        while True:
+            response = self.client.get('/user/user-list/', params)
+            seen += [user['id'] for user in response.data['results']]
+            if not response.data['next_cursor']:
+                break
+            params['cursor'] = response.data['next_cursor']
+        self.assertEqual(seen, sorted(set(seen)))
+        self.assertEqual(len(seen), 25)
+
+class UserDetailViewTests(TestCase):
+
+    def setUp(self):
+        self.user = UserCustomer.objects.create_user(username='detail', password='secret')
+        self.group = Group.objects.create(name='editors')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_changed(self, change):
+        etag = self.client.get(f'/user/user-detail/{self.user.pk}/')['ETag']
+        change()
+        response = self.client.get(f'/user/user-detail/{self.user.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_relation_changes_invalidate_the_etag(self):
+        self.assert_changed(lambda: self.user.groups.add(self.group))
+        self.assert_changed(lambda: self.group.user_set.remove(self.user))
+        self.assert_changed(lambda: self.user.user_permissions.add(Permission.objects.first()))
+        self.assert_changed(lambda: self.group.user_set.add(self.user))
+        self.assert_changed(lambda: self.group.user_set.clear())
+
+    def test_unchanged_user_is_not_modified(self):
+        etag = self.client.get(f'/user/user-detail/{self.user.pk}/')['ETag']
+        response = self.client.get(f'/user/user-detail/{self.user.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+# Nothing listens on port 1, so every cache call fails
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': 'redis://127.0.0.1:1/0',
+}})
+class CachedOAuth2AuthenticationTests(TestCase):
+
+    def setUp(self):
+        self.user = UserCustomer.objects.create_user(username='reader', is_staff=True)
+        application = Application.objects.create(
+            name='reader',
+            user=self.user,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            authorization_grant_type=Application.GRANT_PASSWORD
+        )
+        with self.assertLogs('user.authentication', 'ERROR'):
+            self.token = AccessToken.objects.create(
+                user=self.user,
+                application=application,
+                token='reader-token',
+                expires=timezone.now() + timedelta(hours=1)
+            )
+
+    def test_cache_outage_falls_back_to_the_database(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer reader-token')
+        with self.assertLogs('user.authentication', 'WARNING'):
+            self.assertEqual(client.get('/user/user-list/').status_code, 200)
+
+        with self.assertLogs('user.authentication', 'ERROR'):
+            self.token.delete()
+        with self.assertLogs('user.authentication', 'WARNING'):
+            self.assertEqual(client.get('/user/user-list/').status_code, 401)
@@ -2,7 +2,11 @@ from django.shortcuts import render
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
-from user.serializers import UserSerializer
+from rest_framework.exceptions import ValidationError
+from user.models import UserCustomer
+from user.serializers import UserSerializer, UserListSerializer
+from api.pagination import KeysetPagination
+from api.conditional import ConditionalGetMixin
 from django.shortcuts import redirect
 from google_auth_oauthlib.flow import Flow
 from django.conf import settings
@@ -17,12 +21,46 @@ class UserAddView(APIView):
             return Response(serializer.data,status=status.HTTP_201_CREATED)
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
 class UserListView(APIView):
+    """Cursor-paginated user listing, optionally restricted with ?fields=a,b"""
+    pagination = KeysetPagination(
+        ordering=('id',),
+        default_page_size=settings.USER_PAGE_SIZE,
+        max_page_size=settings.USER_MAX_PAGE_SIZE
+    )
+    related_fields = ('groups', 'user_permissions')
+
+    def get_fields(self, request):
+        available = UserListSerializer.Meta.fields
+        value = request.query_params.get('fields')
+        if not value:
+            return list(available)
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in available]
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}."})
+        return fields
+
     def get(self,request):
-        users = UserCustomer.objects.all()
-        serializer = UserSerializer(users,many=True)
-        return Response(serializer.data)
-class UserDetailView(APIView):
+        fields = self.get_fields(request)
+        # id is always loaded since the cursor is built from it
+        columns = {'id', *(name for name in fields if name not in self.related_fields)}
+        users = UserCustomer.objects.only(*columns)
+        related = [name for name in fields if name in self.related_fields]
+        if related:
+            users = users.prefetch_related(*related)
+        page, next_cursor = self.pagination.paginate_queryset(users, request)
+        serializer = UserListSerializer(page, many=True, fields=fields)
+        return Response({'results': serializer.data, 'next_cursor': next_cursor})
+class UserDetailView(ConditionalGetMixin, APIView):
+    cache_control = {'private': True, 'max_age': settings.USER_CACHE_MAX_AGE}
+
     def get(self,request,pk):
+        # last_login is saved alone on login, without touching last_modified
+        validators = UserCustomer.objects.filter(id=pk).values_list('last_modified', 'last_login').first()
+        if validators is not None:
+            not_modified = self.not_modified(request, pk, *validators)
+            if not_modified is not None:
+                return not_modified
         user = UserCustomer.objects.get(id=pk)
         serializer = UserSerializer(user)
         return Response(serializer.data)